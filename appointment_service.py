@@ -1,16 +1,77 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 import logging
+import random
+import uuid
 from models import Appointment, AppointmentCreate, AppointmentUpdate, AppointmentStatus, Patient, Doctor
 from database import db
 from calendar_service import calendar_service
 from reminder_service import send_whatsapp_reminder
 from utils import sanitize_input
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("appointment")
 
+def _is_retryable_send_error(exc: Exception) -> bool:
+    """Only retry rate limits and server errors; auth/config errors won't recover."""
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'http_status', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, (RuntimeError, ValueError)):
+        return False  # Configuration problems won't fix themselves mid-backoff
+    return True  # Network-level failure, worth retrying
+
+async def retry_with_backoff(fn, attempts: int = 4, base: float = 1.0):
+    """
+    Call a blocking function in a worker thread, retrying with exponential
+    backoff plus jitter (1s, 4s, 16s, ...) so transient rate limits aren't
+    burned through back to back. Returns the first truthy result, or None.
+    """
+    for attempt in range(attempts):
+        try:
+            result = await asyncio.to_thread(fn)
+            if result:
+                return result
+        except Exception as e:
+            if not _is_retryable_send_error(e):
+                raise
+            logger.error("Attempt %s failed: %s", attempt + 1, e)
+        if attempt < attempts - 1:
+            await asyncio.sleep(base * (4 ** attempt) + random.uniform(0, base))
+    return None
+
+# Cap concurrent WhatsApp sends across all background reminder tasks
+_reminder_semaphore = asyncio.Semaphore(8)
+
+# Strong references to in-flight reminder tasks; the event loop only keeps
+# weak refs, so an unreferenced task sleeping out its backoff could be
+# garbage-collected mid-flight
+_reminder_tasks: set = set()
+
+async def _send_reminder_with_retry(patient: Patient, appointment: Appointment, doctor: Doctor) -> None:
+    """Send the WhatsApp reminder in the background, recording failures in metadata."""
+    reminder_sent = False
+    try:
+        async with _reminder_semaphore:
+            reminder_sent = bool(await retry_with_backoff(
+                lambda: send_whatsapp_reminder(
+                    to_number=patient.phone_number,
+                    appointment_time=appointment.scheduled_time,
+                    patient_name=patient.full_name or "Patient",
+                    doctor_name=doctor.name if doctor else None
+                )
+            ))
+    except Exception as e:
+        logger.error("Failed to send WhatsApp reminder: %s", e)
+
+    if not reminder_sent:
+        logger.warning("WhatsApp reminder could not be sent to %s", patient.phone_number)
+        # Record the failure with a single server-side metadata merge
+        await db.merge_appointment_metadata(
+            appointment.id,
+            {'reminder_warning': 'WhatsApp reminder failed'}
+        )
+
 class AppointmentService:
     @staticmethod
     async def schedule_appointment(appointment_data: AppointmentCreate) -> Optional[Appointment]:
@@ -18,68 +79,72 @@ class AppointmentService:
         Schedule a new appointment and create a corresponding calendar event.
         """
         try:
-            # Check if the doctor exists
-            doctor = await db.get_doctor(appointment_data.doctor_id)
+            # Sanitize user input
+            appointment_data.reason = sanitize_input(appointment_data.reason) if appointment_data.reason else None
+
+            # The doctor, patient and conflict-window lookups are independent,
+            # so issue them concurrently instead of paying three round trips
+            doctor, patient, has_conflict = await asyncio.gather(
+                db.get_doctor_cached(appointment_data.doctor_id),
+                db.get_patient_cached(appointment_data.patient_id),
+                AppointmentService._has_scheduling_conflict(appointment_data)
+            )
+
             if not doctor:
-                logger.error(f"Doctor {appointment_data.doctor_id} not found")
+                logger.error("Doctor %s not found", appointment_data.doctor_id)
                 return None
-            
-            # Check if the patient exists
-            patient = await db.get_patient(appointment_data.patient_id)
+
             if not patient:
-                logger.error(f"Patient {appointment_data.patient_id} not found")
+                logger.error("Patient %s not found", appointment_data.patient_id)
                 return None
-            
-            # Sanitize user input
-            appointment_data.reason = sanitize_input(appointment_data.reason) if appointment_data.reason else None
-            # Check for scheduling conflicts
-            if await AppointmentService._has_scheduling_conflict(appointment_data):
+
+            if has_conflict:
                 logger.warning("Scheduling conflict detected")
                 return None
             
-            # Create the appointment in the database
-            appointment = await db.create_appointment(appointment_data)
-            
-            # Create calendar event
-            calendar_event = await calendar_service.create_calendar_event(appointment)
-            
-            # Update appointment with calendar event ID
-            if calendar_event:
-                appointment.metadata = appointment.metadata or {}
-                appointment.metadata['calendar_event_id'] = calendar_event['id']
-                appointment = await db.update_appointment(
-                    appointment.id,
-                    AppointmentUpdate(metadata=appointment.metadata)
+            # Create the calendar event first against a pre-generated ID so
+            # the appointment row can be inserted once with metadata in place,
+            # instead of insert-then-update
+            appointment_id = str(uuid.uuid4())
+            calendar_event = await calendar_service.create_calendar_event_for(
+                doctor_id=appointment_data.doctor_id,
+                patient_id=appointment_data.patient_id,
+                scheduled_time=appointment_data.scheduled_time,
+                duration_minutes=appointment_data.duration_minutes,
+                appointment_ref=appointment_id,
+                reason=appointment_data.reason,
+                notes=appointment_data.notes,
+            )
+
+            # Create the appointment in the database (single INSERT; still
+            # created without metadata if the calendar call failed)
+            try:
+                appointment = await db.create_appointment(
+                    appointment_data,
+                    appointment_id=appointment_id,
+                    metadata={'calendar_event_id': calendar_event['id']} if calendar_event else None
                 )
-            
-            # Send WhatsApp reminder with retry logic
-            reminder_sent = False
-            for attempt in range(2):  # Try twice
-                try:
-                    reminder_sent = send_whatsapp_reminder(
-                        to_number=patient.phone_number,
-                        appointment_time=appointment.scheduled_time,
-                        patient_name=patient.full_name or "Patient",
-                        doctor_name=doctor.name if doctor else None
+            except Exception:
+                # Invitations for the event already went out; best-effort
+                # cleanup so a failed INSERT doesn't leave an orphaned event
+                # on the doctor's calendar
+                if calendar_event and doctor.calendar_id:
+                    await calendar_service.delete_event_by_id(
+                        doctor.calendar_id, calendar_event['id']
                     )
-                    if reminder_sent:
-                        break
-                except Exception as e:
-                    logger.error(f"Failed to send WhatsApp reminder (attempt {attempt+1}): {e}")
-            if not reminder_sent:
-                logger.warning(f"WhatsApp reminder could not be sent to {patient.phone_number}")
-                # Optionally, add a warning to the appointment metadata
-                appointment.metadata['reminder_warning'] = 'WhatsApp reminder failed'
-                await db.update_appointment(
-                    appointment.id,
-                    AppointmentUpdate(metadata=appointment.metadata)
-                )
+                raise
             
-            logger.info(f"Successfully scheduled appointment {appointment.id}")
+            # Fire off the WhatsApp reminder in the background so the caller
+            # gets the appointment back without waiting out the send (or its backoff)
+            task = asyncio.create_task(_send_reminder_with_retry(patient, appointment, doctor))
+            _reminder_tasks.add(task)
+            task.add_done_callback(_reminder_tasks.discard)
+
+            logger.info("Successfully scheduled appointment %s", appointment.id)
             return appointment
             
         except Exception as e:
-            logger.error(f"Error scheduling appointment: {str(e)}")
+            logger.error("Error scheduling appointment: %s", e)
             return None
     
     @staticmethod
@@ -92,27 +157,33 @@ class AppointmentService:
         Reschedule an existing appointment to a new time and optionally with a different doctor.
         """
         try:
-            # Get the existing appointment
-            appointment = await db.get_appointment(appointment_id)
+            # Fetch the appointment and (if changing doctors) the new doctor concurrently
+            if new_doctor_id:
+                appointment, new_doctor = await asyncio.gather(
+                    db.get_appointment(appointment_id),
+                    db.get_doctor_cached(new_doctor_id)
+                )
+            else:
+                appointment = await db.get_appointment(appointment_id)
+                new_doctor = None
+
             if not appointment:
-                logger.error(f"Appointment {appointment_id} not found")
+                logger.error("Appointment %s not found", appointment_id)
                 return None
-            
+
             if appointment.status != AppointmentStatus.SCHEDULED:
-                logger.error(f"Cannot reschedule appointment in status: {appointment.status}")
+                logger.error("Cannot reschedule appointment in status: %s", appointment.status)
                 return None
-            
+
             # Prepare update data
             update_data = {
                 'scheduled_time': new_time,
                 'status': AppointmentStatus.SCHEDULED
             }
-            
+
             if new_doctor_id and new_doctor_id != appointment.doctor_id:
-                # Verify new doctor exists
-                new_doctor = await db.get_doctor(new_doctor_id)
                 if not new_doctor:
-                    logger.error(f"New doctor {new_doctor_id} not found")
+                    logger.error("New doctor %s not found", new_doctor_id)
                     return None
                 update_data['doctor_id'] = new_doctor_id
             
@@ -135,17 +206,17 @@ class AppointmentService:
             )
             
             if not updated_appointment:
-                logger.error(f"Failed to update appointment {appointment_id}")
+                logger.error("Failed to update appointment %s", appointment_id)
                 return None
             
             # Update the calendar event
             await calendar_service.update_calendar_event(updated_appointment)
             
-            logger.info(f"Successfully rescheduled appointment {appointment_id}")
+            logger.info("Successfully rescheduled appointment %s", appointment_id)
             return updated_appointment
             
         except Exception as e:
-            logger.error(f"Error rescheduling appointment: {str(e)}")
+            logger.error("Error rescheduling appointment: %s", e)
             return None
     
     @staticmethod
@@ -154,40 +225,26 @@ class AppointmentService:
         Cancel an appointment and update the calendar event.
         """
         try:
-            # Get the appointment
-            appointment = await db.get_appointment(appointment_id)
-            if not appointment:
-                logger.error(f"Appointment {appointment_id} not found")
-                return False
-            
-            # Only allow cancelling scheduled appointments
-            if appointment.status != AppointmentStatus.SCHEDULED:
-                logger.warning(f"Cannot cancel appointment in status: {appointment.status}")
-                return False
-            
-            # Update the appointment status
-            update_data = {
-                'status': AppointmentStatus.CANCELLED,
-                'notes': f"{appointment.notes or ''}\nCancelled: {reason or 'No reason provided'}".strip()
-            }
-            
-            updated = await db.update_appointment(
+            # Single guarded UPDATE ... RETURNING: the status check happens
+            # server-side, so no read-before-write round trip
+            updated = await db.update_appointment_status(
                 appointment_id,
-                AppointmentUpdate(**update_data)
+                AppointmentStatus.CANCELLED,
+                f"Cancelled: {reason or 'No reason provided'}"
             )
-            
+
             if not updated:
-                logger.error(f"Failed to cancel appointment {appointment_id}")
+                logger.warning("Could not cancel appointment %s (not found or not scheduled)", appointment_id)
                 return False
             
             # Update the calendar event
             await calendar_service.update_calendar_event(updated)
             
-            logger.info(f"Successfully cancelled appointment {appointment_id}")
+            logger.info("Successfully cancelled appointment %s", appointment_id)
             return True
             
         except Exception as e:
-            logger.error(f"Error cancelling appointment: {str(e)}")
+            logger.error("Error cancelling appointment: %s", e)
             return False
     
     @staticmethod
@@ -196,40 +253,26 @@ class AppointmentService:
         Mark an appointment as completed.
         """
         try:
-            # Get the appointment
-            appointment = await db.get_appointment(appointment_id)
-            if not appointment:
-                logger.error(f"Appointment {appointment_id} not found")
-                return False
-            
-            # Only allow completing scheduled appointments
-            if appointment.status != AppointmentStatus.SCHEDULED:
-                logger.warning(f"Cannot complete appointment in status: {appointment.status}")
-                return False
-            
-            # Update the appointment status
-            update_data = {
-                'status': AppointmentStatus.COMPLETED,
-                'notes': f"{appointment.notes or ''}\nCompleted: {notes or 'No notes provided'}".strip()
-            }
-            
-            updated = await db.update_appointment(
+            # Single guarded UPDATE ... RETURNING: the status check happens
+            # server-side, so no read-before-write round trip
+            updated = await db.update_appointment_status(
                 appointment_id,
-                AppointmentUpdate(**update_data)
+                AppointmentStatus.COMPLETED,
+                f"Completed: {notes or 'No notes provided'}"
             )
-            
+
             if not updated:
-                logger.error(f"Failed to mark appointment {appointment_id} as completed")
+                logger.warning("Could not complete appointment %s (not found or not scheduled)", appointment_id)
                 return False
             
             # Update the calendar event
             await calendar_service.update_calendar_event(updated)
             
-            logger.info(f"Successfully marked appointment {appointment_id} as completed")
+            logger.info("Successfully marked appointment %s as completed", appointment_id)
             return True
             
         except Exception as e:
-            logger.error(f"Error completing appointment: {str(e)}")
+            logger.error("Error completing appointment: %s", e)
             return False
     
     @staticmethod
@@ -243,20 +286,15 @@ class AppointmentService:
         """
         try:
             # Get doctor's working hours
-            doctor = await db.get_doctor(doctor_id)
+            doctor = await db.get_doctor_cached(doctor_id)
             if not doctor:
-                logger.error(f"Doctor {doctor_id} not found")
+                logger.error("Doctor %s not found", doctor_id)
                 return []
             
-            # Get the day of week (0=Monday, 6=Sunday)
-            weekday = date.weekday()
-            weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-            day_name = weekdays[weekday].lower()
-            
-            # Get working hours for this day
-            working_hours = doctor.working_hours.get(day_name, [])
-            if not working_hours:
-                logger.info(f"Doctor {doctor_id} does not work on {day_name}")
+            # Working hours come pre-parsed per weekday as seconds since midnight
+            working_ranges = doctor.working_hours_by_weekday()[date.weekday()]
+            if not working_ranges:
+                logger.info("Doctor %s does not work on %s", doctor_id, date.strftime('%A'))
                 return []
             
             # Get existing appointments for this doctor on this day
@@ -271,43 +309,60 @@ class AppointmentService:
                 end_date=end_of_day
             )
             
-            # Generate available slots
-            available_slots = []
-            
-            for time_range in working_hours:
-                current_time = datetime.combine(date.date(), time_range['start'])
-                end_time = datetime.combine(date.date(), time_range['end'])
-                
-                while current_time + timedelta(minutes=duration_minutes) <= end_time:
-                    slot_end = current_time + timedelta(minutes=duration_minutes)
-                    
-                    # Check if this slot is available
-                    is_available = True
-                    for appt in all_appointments:
-                        appt_start = appt.scheduled_time
-                        appt_end = appt_start + timedelta(minutes=appt.duration_minutes)
-                        
-                        # Check for overlap
-                        if (current_time < appt_end and slot_end > appt_start):
-                            is_available = False
-                            current_time = appt_end  # Skip past this appointment
-                            break
-                    
-                    if is_available:
-                        available_slots.append({
-                            'start': current_time,
-                            'end': slot_end,
-                            'duration_minutes': duration_minutes
-                        })
-                        current_time += timedelta(minutes=15)  # Next slot starts 15 minutes later
-                    
-                    if not is_available:
-                        continue  # Already moved current_time past the conflicting appointment
-            
-            return available_slots
+            # Precompute appointment windows once as sorted POSIX seconds so the
+            # sweep below works on integer compares instead of datetime arithmetic
+            appt_windows = sorted(
+                (int(appt.scheduled_time.timestamp()),
+                 int(appt.scheduled_time.timestamp()) + appt.duration_minutes * 60)
+                for appt in all_appointments
+            )
+            appt_starts = [w[0] for w in appt_windows]
+            appt_ends = [w[1] for w in appt_windows]
+            n_appts = len(appt_windows)
+
+            # Generate available slots with a single linear sweep per working
+            # range: walk candidate slots forward while advancing a pointer
+            # through the sorted appointments, O(slots + appts) instead of
+            # re-scanning every appointment for every slot
+            slot_bounds = []
+            duration_seconds = duration_minutes * 60
+            slot_step_seconds = 15 * 60  # Next slot starts 15 minutes later
+
+            day_start_s = int(start_of_day.timestamp())
+
+            for range_start_s, range_end_s in working_ranges:
+                current_s = day_start_s + range_start_s
+                end_s = day_start_s + range_end_s
+                i = 0
+
+                while current_s + duration_seconds <= end_s:
+                    slot_end_s = current_s + duration_seconds
+
+                    # Skip appointments that end at or before the slot start
+                    while i < n_appts and appt_ends[i] <= current_s:
+                        i += 1
+
+                    if i < n_appts and appt_starts[i] < slot_end_s:
+                        # Overlap: jump past the conflicting appointment
+                        current_s = appt_ends[i]
+                        continue
+
+                    slot_bounds.append((current_s, slot_end_s))
+                    current_s += slot_step_seconds
+
+            # Materialize datetimes and dicts once, at the output boundary,
+            # instead of allocating them inside the sweep
+            return [
+                {
+                    'start': datetime.fromtimestamp(start_s),
+                    'end': datetime.fromtimestamp(end_s),
+                    'duration_minutes': duration_minutes
+                }
+                for start_s, end_s in slot_bounds
+            ]
             
         except Exception as e:
-            logger.error(f"Error getting available slots: {str(e)}")
+            logger.error("Error getting available slots: %s", e)
             return []
     
     @staticmethod
@@ -319,34 +374,25 @@ class AppointmentService:
         Check if scheduling this appointment would cause a conflict.
         """
         try:
-            # Get all appointments for this doctor around this time
-            start_time = appointment.scheduled_time - timedelta(minutes=30)
-            end_time = appointment.scheduled_time + timedelta(minutes=appointment.duration_minutes + 30)
-            
-            # Get conflicting appointments
-            # Note: This is a simplified example - in a real app, you'd use a proper query
-            appointments = await db.get_doctor_appointments(
+            # Let the database do the overlap test: one indexed EXISTS query,
+            # no appointment rows pulled over the wire
+            new_start = appointment.scheduled_time
+            new_end = new_start + timedelta(minutes=appointment.duration_minutes)
+
+            conflict = await db.has_conflict(
                 doctor_id=appointment.doctor_id,
-                start_date=start_time,
-                end_date=end_time,
+                start_time=new_start,
+                end_time=new_end,
                 exclude_appointment_id=exclude_appointment_id
             )
-            
-            # Check for overlap with each existing appointment
-            for existing_appt in appointments:
-                existing_start = existing_appt.scheduled_time
-                existing_end = existing_start + timedelta(minutes=existing_appt.duration_minutes)
-                
-                new_start = appointment.scheduled_time
-                new_end = new_start + timedelta(minutes=appointment.duration_minutes)
-                
-                if new_start < existing_end and new_end > existing_start:
-                    return True  # Conflict found
-            
-            return False  # No conflicts
-            
+
+            if conflict is None:
+                return True  # Assume conflict on error to be safe
+
+            return conflict
+
         except Exception as e:
-            logger.error(f"Error checking scheduling conflict: {str(e)}")
+            logger.error("Error checking scheduling conflict: %s", e)
             return True  # Assume conflict on error to be safe
 
 # Initialize appointment service
@@ -1,39 +1,51 @@
+import asyncio
+import json
 import os
+import threading
 from datetime import datetime, timedelta
+from functools import cached_property
+from pathlib import Path
 from typing import List, Optional, Dict, Any
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import HttpError
-import pickle
+import google_auth_httplib2
+import httplib2
 import logging
 from models import Appointment, AppointmentStatus, Doctor
 from database import db
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("calendar")
 
-# If modifying these scopes, delete the file token.pickle.
+# If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar']
-TOKEN_FILE = 'token.pickle'
+TOKEN_FILE = 'token.json'
 CREDENTIALS_FILE = 'credentials.json'
+# Optional on-disk copy of the Calendar v3 discovery document, from
+# https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest
+DISCOVERY_FILE = 'calendar_v3_discovery.json'
 
 class CalendarService:
     def __init__(self):
-        self.creds = self._get_credentials()
-        self.service = build('calendar', 'v3', credentials=self.creds)
-    
+        # Credentials and the API client are built lazily on first use, so
+        # importing this module stays cheap and never triggers an OAuth flow
+        self._creds_lock = threading.Lock()
+        # Per-thread transports for _gcall; httplib2.Http is not thread-safe
+        self._local = threading.local()
+
     def _get_credentials(self):
         """Get valid user credentials from storage or run the OAuth flow."""
         creds = None
-        
-        # The file token.pickle stores the user's access and refresh tokens
-        if os.path.exists(TOKEN_FILE):
-            with open(TOKEN_FILE, 'rb') as token:
-                creds = pickle.load(token)
-        
+
+        # The file token.json stores the user's access and refresh tokens
+        token_path = Path(TOKEN_FILE)
+        if token_path.exists():
+            creds = Credentials.from_authorized_user_info(
+                json.loads(token_path.read_text()), SCOPES
+            )
+
         # If there are no (valid) credentials available, let the user log in.
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
@@ -46,38 +58,98 @@ class CalendarService:
                     )
                 flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
                 creds = flow.run_local_server(port=0)
-            
+
             # Save the credentials for the next run
-            with open(TOKEN_FILE, 'wb') as token:
-                pickle.dump(creds, token)
-        
+            token_path.write_text(creds.to_json())
+
         return creds
-    
-    async def create_calendar_event(self, appointment: Appointment) -> Optional[Dict[str, Any]]:
-        """Create a calendar event for an appointment."""
+
+    @cached_property
+    def creds(self):
+        # Locked so concurrent first uses don't stampede the token refresh
+        with self._creds_lock:
+            return self._get_credentials()
+
+    @cached_property
+    def service(self):
+        # The client is built once (static discovery avoids fetching and
+        # parsing the discovery document at build time), but requests execute
+        # on per-thread transports -- see _gcall
+        authed_http = google_auth_httplib2.AuthorizedHttp(
+            self.creds, http=httplib2.Http(timeout=10)
+        )
+
+        # Prefer a discovery document cached on disk: no JSON re-download and
+        # no dependency on Google being reachable at boot. Otherwise fall back
+        # to the copy bundled with the client library.
+        discovery_path = Path(DISCOVERY_FILE)
+        if discovery_path.exists():
+            return build_from_document(discovery_path.read_text(), http=authed_http)
+
+        return build(
+            'calendar', 'v3',
+            http=authed_http,
+            cache_discovery=False,
+            static_discovery=True,
+        )
+
+    def _execute(self, request):
+        # httplib2.Http is not thread-safe, so each worker thread gets its own
+        # keep-alive transport instead of sharing the one baked into `service`;
+        # to_thread reuses pool threads, so connections still get reused
+        http = getattr(self._local, 'authed_http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(
+                self.creds, http=httplib2.Http(timeout=10)
+            )
+            self._local.authed_http = http
+        return request.execute(http=http)
+
+    async def _gcall(self, request):
+        """
+        Execute a googleapiclient request in a worker thread so the blocking
+        HTTP call does not stall the event loop.
+        """
+        return await asyncio.to_thread(self._execute, request)
+
+    async def create_calendar_event_for(
+        self,
+        doctor_id: str,
+        patient_id: str,
+        scheduled_time: datetime,
+        duration_minutes: int,
+        appointment_ref: str,
+        reason: Optional[str] = None,
+        notes: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Create a calendar event for an appointment that may not be persisted
+        yet; appointment_ref is the (possibly pre-generated) appointment ID
+        recorded in the event description.
+        """
         try:
             # Get doctor's calendar ID
-            doctor = await db.get_doctor(appointment.doctor_id)
+            doctor = await db.get_doctor_cached(doctor_id)
             if not doctor or not doctor.calendar_id:
-                logger.error(f"Doctor {appointment.doctor_id} not found or has no calendar ID")
+                logger.error("Doctor %s not found or has no calendar ID", doctor_id)
                 return None
-            
+
             # Get patient details
-            patient = await db.get_patient(appointment.patient_id)
+            patient = await db.get_patient_cached(patient_id)
             if not patient:
-                logger.error(f"Patient {appointment.patient_id} not found")
+                logger.error("Patient %s not found", patient_id)
                 return None
-            
+
             # Format start and end times
-            start_time = appointment.scheduled_time.isoformat()
-            end_time = (appointment.scheduled_time + timedelta(minutes=appointment.duration_minutes)).isoformat()
-            
+            start_time = scheduled_time.isoformat()
+            end_time = (scheduled_time + timedelta(minutes=duration_minutes)).isoformat()
+
             # Create event
             event = {
                 'summary': f'Appointment with {patient.full_name or "Patient"}',
-                'description': f'Appointment ID: {appointment.id}\n'
-                             f'Reason: {appointment.reason or "Not specified"}\n'
-                             f'Notes: {appointment.notes or ""}',
+                'description': f'Appointment ID: {appointment_ref}\n'
+                             f'Reason: {reason or "Not specified"}\n'
+                             f'Notes: {notes or ""}',
                 'start': {
                     'dateTime': start_time,
                     'timeZone': 'UTC',
@@ -87,8 +159,7 @@ class CalendarService:
                     'timeZone': 'UTC',
                 },
                 'attendees': [
-                    {'email': patient.email} if patient.email else None,
-                    {'email': doctor.email} if hasattr(doctor, 'email') and doctor.email else None,
+                    {'email': e} for e in (patient.email, getattr(doctor, 'email', None)) if e
                 ],
                 'reminders': {
                     'useDefault': False,
@@ -103,98 +174,119 @@ class CalendarService:
                 'transparency': 'opaque',
                 'visibility': 'private',
             }
-            
-            # Remove None values from attendees
-            event['attendees'] = [a for a in event['attendees'] if a is not None]
-            
+
             # Create the event
-            created_event = self.service.events().insert(
+            created_event = await self._gcall(self.service.events().insert(
                 calendarId=doctor.calendar_id,
                 body=event,
                 sendUpdates='all',
-            ).execute()
-            
-            logger.info(f"Created calendar event {created_event['id']} for appointment {appointment.id}")
+            ))
+
+            logger.info("Created calendar event %s for appointment %s", created_event['id'], appointment_ref)
             return created_event
-            
+
         except HttpError as error:
-            logger.error(f"An error occurred while creating calendar event: {error}")
+            logger.error("An error occurred while creating calendar event: %s", error)
             return None
+
+    async def create_calendar_event(self, appointment: Appointment) -> Optional[Dict[str, Any]]:
+        """Create a calendar event for an existing appointment."""
+        return await self.create_calendar_event_for(
+            doctor_id=appointment.doctor_id,
+            patient_id=appointment.patient_id,
+            scheduled_time=appointment.scheduled_time,
+            duration_minutes=appointment.duration_minutes,
+            appointment_ref=appointment.id,
+            reason=appointment.reason,
+            notes=appointment.notes,
+        )
     
     async def update_calendar_event(self, appointment: Appointment) -> Optional[Dict[str, Any]]:
         """Update an existing calendar event for an appointment."""
         try:
             if not appointment.metadata or 'calendar_event_id' not in appointment.metadata:
-                logger.warning(f"Appointment {appointment.id} has no associated calendar event")
+                logger.warning("Appointment %s has no associated calendar event", appointment.id)
                 return await self.create_calendar_event(appointment)
             
-            doctor = await db.get_doctor(appointment.doctor_id)
+            doctor = await db.get_doctor_cached(appointment.doctor_id)
             if not doctor or not doctor.calendar_id:
-                logger.error(f"Doctor {appointment.doctor_id} not found or has no calendar ID")
+                logger.error("Doctor %s not found or has no calendar ID", appointment.doctor_id)
                 return None
             
-            # Get the existing event
-            event = self.service.events().get(
-                calendarId=doctor.calendar_id,
-                eventId=appointment.metadata['calendar_event_id']
-            ).execute()
-            
-            # Update event details
-            event['status'] = 'confirmed' if appointment.status == 'scheduled' else appointment.status
-            
-            if appointment.status == 'cancelled':
-                event['status'] = 'cancelled'
-            
-            # Update times if they've changed
-            event['start']['dateTime'] = appointment.scheduled_time.isoformat()
-            event['end']['dateTime'] = (
-                appointment.scheduled_time + timedelta(minutes=appointment.duration_minutes)
-            ).isoformat()
-            
-            # Update the event
-            updated_event = self.service.events().update(
+            # PATCH only the fields that change -- no GET round trip needed
+            event_status = 'confirmed' if appointment.status == AppointmentStatus.SCHEDULED else appointment.status
+
+            if appointment.status == AppointmentStatus.CANCELLED:
+                event_status = 'cancelled'
+
+            patch_body = {
+                'status': event_status,
+                'start': {
+                    'dateTime': appointment.scheduled_time.isoformat(),
+                    'timeZone': 'UTC',
+                },
+                'end': {
+                    'dateTime': (
+                        appointment.scheduled_time + timedelta(minutes=appointment.duration_minutes)
+                    ).isoformat(),
+                    'timeZone': 'UTC',
+                },
+            }
+
+            updated_event = await self._gcall(self.service.events().patch(
                 calendarId=doctor.calendar_id,
                 eventId=appointment.metadata['calendar_event_id'],
-                body=event,
+                body=patch_body,
                 sendUpdates='all',
-            ).execute()
+            ))
             
-            logger.info(f"Updated calendar event {updated_event['id']} for appointment {appointment.id}")
+            logger.info("Updated calendar event %s for appointment %s", updated_event['id'], appointment.id)
             return updated_event
             
         except HttpError as error:
             if error.resp.status == 404:  # Event not found
-                logger.warning(f"Calendar event not found, creating new one for appointment {appointment.id}")
+                logger.warning("Calendar event not found, creating new one for appointment %s", appointment.id)
                 return await self.create_calendar_event(appointment)
-            logger.error(f"An error occurred while updating calendar event: {error}")
+            logger.error("An error occurred while updating calendar event: %s", error)
             return None
     
+    async def delete_event_by_id(self, calendar_id: str, event_id: str) -> bool:
+        """Delete a calendar event directly by calendar and event ID."""
+        try:
+            await self._gcall(self.service.events().delete(
+                calendarId=calendar_id,
+                eventId=event_id,
+                sendUpdates='all',
+            ))
+            return True
+
+        except HttpError as error:
+            if error.resp.status == 410:  # Already deleted
+                return True
+            logger.error("An error occurred while deleting calendar event: %s", error)
+            return False
+
     async def delete_calendar_event(self, appointment: Appointment) -> bool:
         """Delete a calendar event for an appointment."""
         try:
             if not appointment.metadata or 'calendar_event_id' not in appointment.metadata:
-                logger.warning(f"Appointment {appointment.id} has no associated calendar event to delete")
+                logger.warning("Appointment %s has no associated calendar event to delete", appointment.id)
                 return False
-            
-            doctor = await db.get_doctor(appointment.doctor_id)
+
+            doctor = await db.get_doctor_cached(appointment.doctor_id)
             if not doctor or not doctor.calendar_id:
-                logger.error(f"Doctor {appointment.doctor_id} not found or has no calendar ID")
+                logger.error("Doctor %s not found or has no calendar ID", appointment.doctor_id)
                 return False
-            
-            self.service.events().delete(
-                calendarId=doctor.calendar_id,
-                eventId=appointment.metadata['calendar_event_id'],
-                sendUpdates='all',
-            ).execute()
-            
-            logger.info(f"Deleted calendar event for appointment {appointment.id}")
-            return True
-            
-        except HttpError as error:
-            if error.resp.status == 410:  # Already deleted
-                logger.warning(f"Calendar event already deleted for appointment {appointment.id}")
-                return True
-            logger.error(f"An error occurred while deleting calendar event: {error}")
+
+            deleted = await self.delete_event_by_id(
+                doctor.calendar_id, appointment.metadata['calendar_event_id']
+            )
+            if deleted:
+                logger.info("Deleted calendar event for appointment %s", appointment.id)
+            return deleted
+
+        except Exception as error:
+            logger.error("An error occurred while deleting calendar event: %s", error)
             return False
 
 # Initialize calendar service
@@ -1,36 +1,53 @@
-import os
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
-from pydantic import BaseSettings, PostgresDsn, validator, AnyHttpUrl
+from pydantic import BaseSettings, Field, PostgresDsn, validator
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Env vars holding comma-separated lists; parsed once by Config.parse_env_var
+_CSV_FIELDS = {"CORS_ORIGINS", "API_KEYS"}
+
 class Settings(BaseSettings):
     # Application Settings
     APP_NAME: str = "SYRAA"
     APP_VERSION: str = "1.0.0"
-    DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
-    ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
-    SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
+    DEBUG: bool = False
+    ENVIRONMENT: str = "development"
+    SECRET_KEY: str = "your-secret-key-here"
     API_V1_STR: str = "/api/v1"
-    
+
     # Server Settings
-    HOST: str = os.getenv("HOST", "0.0.0.0")
-    PORT: int = int(os.getenv("PORT", "8000"))
-    
-    # CORS Settings
-    BACKEND_CORS_ORIGINS: List[str] = os.getenv("BACKEND_CORS_ORIGINS", "*").split(",")
-    
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+
+    # CORS (single setting; accepts a CSV string or a list)
+    CORS_ORIGINS: List[str] = Field(default_factory=lambda: ["*"])
+
     # Database Settings
-    POSTGRES_SERVER: str = os.getenv("POSTGRES_SERVER", "localhost")
-    POSTGRES_USER: str = os.getenv("POSTGRES_USER", "postgres")
-    POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgres")
-    POSTGRES_DB: str = os.getenv("POSTGRES_DB", "syraa")
+    POSTGRES_SERVER: str = "localhost"
+    POSTGRES_USER: str = "postgres"
+    POSTGRES_PASSWORD: str = "postgres"
+    POSTGRES_DB: str = "syraa"
     DATABASE_URI: Optional[PostgresDsn] = None
-    
+    SYNC_DATABASE_URI: Optional[PostgresDsn] = None
+
     @validator("DATABASE_URI", pre=True)
     def assemble_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
+        if isinstance(v, str):
+            return v
+        return PostgresDsn.build(
+            scheme="postgresql+asyncpg",
+            user=values.get("POSTGRES_USER"),
+            password=values.get("POSTGRES_PASSWORD"),
+            host=values.get("POSTGRES_SERVER"),
+            path=f"/{values.get('POSTGRES_DB') or ''}",
+        )
+
+    @validator("SYNC_DATABASE_URI", pre=True)
+    def assemble_sync_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
+        # Plain postgresql:// DSN for Alembic and other sync tooling
         if isinstance(v, str):
             return v
         return PostgresDsn.build(
@@ -40,62 +57,67 @@ class Settings(BaseSettings):
             host=values.get("POSTGRES_SERVER"),
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
-    
+
     # Supabase Settings
-    SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
-    SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
-    SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY", "")
-    
+    SUPABASE_URL: str = ""
+    SUPABASE_KEY: str = ""
+    SUPABASE_SERVICE_KEY: str = ""
+
     # LiveKit Settings
-    LIVEKIT_URL: str = os.getenv("LIVEKIT_URL", "")
-    LIVEKIT_API_KEY: str = os.getenv("LIVEKIT_API_KEY", "")
-    LIVEKIT_API_SECRET: str = os.getenv("LIVEKIT_API_SECRET", "")
-    
+    LIVEKIT_URL: str = ""
+    LIVEKIT_API_KEY: str = ""
+    LIVEKIT_API_SECRET: str = ""
+
     # Google Settings
-    GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "")
-    GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
-    GOOGLE_REDIRECT_URI: str = os.getenv("GOOGLE_REDIRECT_URI", "")
-    GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
-    
+    GOOGLE_CLIENT_ID: str = ""
+    GOOGLE_CLIENT_SECRET: str = ""
+    GOOGLE_REDIRECT_URI: str = ""
+    GEMINI_API_KEY: str = ""
+
     # Plivo Settings
-    PLIVO_AUTH_ID: str = os.getenv("PLIVO_AUTH_ID", "")
-    PLIVO_AUTH_TOKEN: str = os.getenv("PLIVO_AUTH_TOKEN", "")
-    PLIVO_PHONE_NUMBER: str = os.getenv("PLIVO_PHONE_NUMBER", "")
-    
+    PLIVO_AUTH_ID: str = ""
+    PLIVO_AUTH_TOKEN: str = ""
+    PLIVO_PHONE_NUMBER: str = ""
+
     # Deepgram Settings
-    DEEPGRAM_API_KEY: str = os.getenv("DEEPGRAM_API_KEY", "")
-    
+    DEEPGRAM_API_KEY: str = ""
+
     # Redis Settings
-    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-    
+    REDIS_URL: str = "redis://localhost:6379/0"
+
     # JWT Settings
-    JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-jwt-secret-key")
-    JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # 24 hours
-    
+    JWT_SECRET_KEY: str = "your-jwt-secret-key"
+    JWT_ALGORITHM: str = "HS256"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440  # 24 hours
+
     # Security
-    SECURE_COOKIE: bool = os.getenv("SECURE_COOKIE", "false").lower() == "true"
-    SAME_SITE: str = os.getenv("SAME_SITE", "lax")  # 'lax', 'strict', 'none'
-    
+    SECURE_COOKIE: bool = False
+    SAME_SITE: str = "lax"  # 'lax', 'strict', 'none'
+
     # Logging
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
-    
-    # CORS
-    CORS_ORIGINS: List[str] = os.getenv("CORS_ORIGINS", "*").split(",")
-    
+    LOG_LEVEL: str = "INFO"
+
     # Rate Limiting
-    RATE_LIMIT: str = os.getenv("RATE_LIMIT", "100/minute")
-    
+    RATE_LIMIT: str = "100/minute"
+
     # API Keys
-    API_KEYS: List[str] = os.getenv("API_KEYS", "").split(",") if os.getenv("API_KEYS") else []
-    
+    API_KEYS: List[str] = Field(default_factory=list)
+
     class Config:
         case_sensitive = True
         env_file = ".env"
         env_file_encoding = "utf-8"
 
-# Initialize settings
-settings = Settings()
+        @classmethod
+        def parse_env_var(cls, field_name: str, raw_val: str) -> Any:
+            if field_name in _CSV_FIELDS:
+                return [item.strip() for item in raw_val.split(",") if item.strip()]
+            return cls.json_loads(raw_val)
+
+@lru_cache()
+def get_settings() -> Settings:
+    """Parse the environment once; tests can clear the cache to swap envs."""
+    return Settings()
 
-# Update database URL after initialization
-settings.DATABASE_URI = str(settings.DATABASE_URI).replace("postgresql://", "postgresql+asyncpg://")
+# Initialize settings
+settings = get_settings()
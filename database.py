@@ -1,7 +1,12 @@
+import asyncio
+import functools
+import json
 import os
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-from supabase import create_client, Client as SupabaseClient
+import asyncpg
+from cachetools import TTLCache
+from supabase import acreate_client, AsyncClient
 from dotenv import load_dotenv
 import logging
 from models import Patient, PatientCreate, PatientUpdate, Appointment, AppointmentCreate, AppointmentUpdate, Doctor
@@ -13,141 +18,613 @@ logger = logging.getLogger("database")
 # Load environment variables
 load_dotenv()
 
+def db_op(default=None, reraise=False):
+    """
+    Shared error policy for DatabaseService methods: log the failure (with
+    deferred %-formatting, so nothing is built unless the handler fires)
+    and either re-raise or return the given default.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                logger.error("%s failed: %s", func.__name__, e)
+                if reraise:
+                    raise
+                return default
+        return wrapper
+    return decorator
+
+def _utc_iso_now() -> str:
+    """Current UTC time as an ISO-8601 string, the format Supabase stores."""
+    return datetime.utcnow().isoformat()
+
+def _dump(model, exclude_unset: bool = False) -> Dict[str, Any]:
+    """
+    Serialize a model straight to JSON-ready primitives. On pydantic v2,
+    model_dump(mode="json") converts datetimes/UUIDs in one pass instead of
+    leaving them for the HTTP client's encoder; on v1, .dict() is the only
+    option and the client still handles the conversion.
+    """
+    if hasattr(model, "model_dump"):
+        return model.model_dump(mode="json", exclude_unset=exclude_unset)
+    return model.dict(exclude_unset=exclude_unset)
+
+def _columns(model_cls) -> str:
+    """Comma-joined column projection matching a model's declared fields."""
+    fields = getattr(model_cls, "model_fields", None) or model_cls.__fields__
+    return ",".join(fields)
+
+# Explicit projections so reads only pull the columns the models use,
+# instead of select("*") dragging every column over the wire
+PATIENT_COLS = _columns(Patient)
+APPOINTMENT_COLS = _columns(Appointment)
+DOCTOR_COLS = _columns(Doctor)
+
+class _IdLoader:
+    """
+    Coalesce point lookups by ID that arrive within a short window into a
+    single IN (...) query (the DataLoader pattern). Concurrent calls share
+    one round trip instead of firing one select each.
+    """
+
+    def __init__(self, fetch_batch, window: float = 0.01, max_batch: int = 100):
+        self._fetch_batch = fetch_batch  # async: List[str] -> Dict[str, dict]
+        self._window = window
+        self._max_batch = max_batch
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_scheduled = False
+
+    def load(self, row_id: str) -> "asyncio.Future":
+        """Return a future resolving to the row dict for row_id (or None)."""
+        loop = asyncio.get_running_loop()
+
+        future = self._pending.get(row_id)
+        if future is not None:
+            return future
+
+        future = loop.create_future()
+        self._pending[row_id] = future
+
+        if len(self._pending) >= self._max_batch:
+            self._flush_scheduled = True
+            loop.call_soon(self._start_flush)
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_later(self._window, self._start_flush)
+
+        return future
+
+    def _start_flush(self) -> None:
+        asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            rows = await self._fetch_batch(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for row_id, future in pending.items():
+            if not future.done():
+                future.set_result(rows.get(row_id))
+
+class _InsertBatcher:
+    """
+    Coalesce single-row inserts that arrive within a short window into one
+    bulk PostgREST insert, so bursty writers pay one HTTP round trip per
+    batch instead of one per row.
+    """
+
+    def __init__(self, insert_batch, window: float = 0.01, max_batch: int = 32):
+        self._insert_batch = insert_batch  # async: List[dict] -> List[dict]
+        self._window = window
+        self._max_batch = max_batch
+        self._pending: List[tuple] = []  # (row, future)
+        self._flush_scheduled = False
+
+    def add(self, row: Dict[str, Any]) -> "asyncio.Future":
+        """Enqueue a row; the future resolves to the inserted row's data."""
+        loop = asyncio.get_running_loop()
+
+        future = loop.create_future()
+        self._pending.append((row, future))
+
+        if len(self._pending) >= self._max_batch:
+            self._flush_scheduled = True
+            loop.call_soon(self._start_flush)
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_later(self._window, self._start_flush)
+
+        return future
+
+    def _start_flush(self) -> None:
+        asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        try:
+            inserted = await self._insert_batch([row for row, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), data in zip(pending, inserted):
+            if not future.done():
+                future.set_result(data)
+
 class DatabaseService:
     def __init__(self):
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_KEY")
-        
+
         if not self.supabase_url or not self.supabase_key:
             raise ValueError("Missing Supabase URL or key in environment variables")
-            
-        self.supabase: SupabaseClient = create_client(self.supabase_url, self.supabase_key)
-        logger.info("Initialized Supabase client")
-    
+
+        # The async client needs a running event loop, so it is created
+        # lazily on first use instead of at import time
+        self._supabase: Optional[AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+
+        # Optional direct-Postgres path through Supavisor (port 6543,
+        # transaction mode). When the DSN is set, hot single-row and range
+        # reads skip PostgREST entirely; everything else stays on the REST
+        # client, which also serves as the fallback when the DSN is unset.
+        self._supavisor_dsn = os.getenv("SUPAVISOR_DSN")
+        self._pool: Optional[asyncpg.Pool] = None
+
+        # In-process caches for read-mostly rows: doctors change rarely,
+        # patients somewhat more often, so the TTLs differ
+        self._doctor_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+        self._patient_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+        # Phone lookups happen on every inbound call, so they get their own
+        # cache keyed by number; kept short-lived like the patient cache
+        self._phone_cache: TTLCache = TTLCache(maxsize=2048, ttl=30)
+        # Per-key fill locks, TTL-bounded like the data caches: phone keys are
+        # caller-controlled, so an unbounded dict would grow with every
+        # distinct inbound number. Losing a lock to eviction only weakens
+        # stampede protection for that key, it never breaks correctness.
+        self._cache_locks: TTLCache = TTLCache(maxsize=4096, ttl=60)
+
+        # Loaders coalescing concurrent point lookups into one IN query
+        self._patient_loader = _IdLoader(
+            lambda ids: self._fetch_rows_by_ids("patients", PATIENT_COLS, ids)
+        )
+        self._doctor_loader = _IdLoader(
+            lambda ids: self._fetch_rows_by_ids("doctors", DOCTOR_COLS, ids)
+        )
+
+        # Batcher coalescing bursty appointment inserts into bulk writes
+        self._appointment_batcher = _InsertBatcher(
+            lambda rows: self._insert_rows("appointments", rows)
+        )
+
+    async def _client(self) -> AsyncClient:
+        """Get the shared async Supabase client, creating it on first use."""
+        if self._supabase is None:
+            async with self._client_lock:
+                if self._supabase is None:
+                    self._supabase = await acreate_client(self.supabase_url, self.supabase_key)
+                    logger.info("Initialized Supabase async client")
+        return self._supabase
+
+    @staticmethod
+    async def _init_pool_conn(conn: asyncpg.Connection) -> None:
+        # jsonb columns (appointment metadata) should round-trip as dicts
+        await conn.set_type_codec(
+            'jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog'
+        )
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        """Get the shared asyncpg pool, creating it on first use."""
+        if self._pool is None:
+            async with self._client_lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        dsn=self._supavisor_dsn,
+                        min_size=2,
+                        max_size=12,
+                        max_inactive_connection_lifetime=60,
+                        # Transaction-mode pooling multiplexes checkouts across
+                        # backends, so prepared statements cannot be reused
+                        statement_cache_size=0,
+                        init=self._init_pool_conn,
+                    )
+                    logger.info("Initialized Supavisor connection pool")
+        return self._pool
+
+    async def _fetch_one(self, sql: str, *args) -> Optional[Dict[str, Any]]:
+        """Run a single-row query on the pool, returning a plain dict."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(sql, *args)
+        return dict(row) if row is not None else None
+
+    async def _fetch_all(self, sql: str, *args) -> List[Dict[str, Any]]:
+        """Run a multi-row query on the pool, returning plain dicts."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(sql, *args)
+        return [dict(row) for row in rows]
+
+    async def _fetch_rows_by_ids(self, table: str, cols: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch a batch of rows from a table by ID, keyed by stringified ID."""
+        if self._supavisor_dsn:
+            rows = await self._fetch_all(
+                f"SELECT {cols} FROM {table} WHERE id = ANY($1::uuid[])", ids
+            )
+        else:
+            supabase = await self._client()
+            result = await supabase.table(table).select(cols).in_("id", ids).execute()
+            rows = result.data
+        return {str(row["id"]): row for row in rows}
+
+    async def _insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch of rows into a table in one request."""
+        supabase = await self._client()
+        result = await supabase.table(table).insert(rows).execute()
+        return result.data
+
+    def _cache_lock(self, key: str) -> asyncio.Lock:
+        """Get (or create) the per-key lock that stampede-protects a cache fill."""
+        lock = self._cache_locks.get(key)
+        if lock is None:
+            lock = self._cache_locks.setdefault(key, asyncio.Lock())
+        return lock
+
     # Patient CRUD Operations
+    @db_op(reraise=True)
     async def create_patient(self, patient: PatientCreate) -> Patient:
         """Create a new patient record."""
-        try:
-            result = self.supabase.table("patients").insert(patient.dict()).execute()
-            return Patient(**result.data[0])
-        except Exception as e:
-            logger.error(f"Error creating patient: {str(e)}")
-            raise
-    
+        supabase = await self._client()
+        result = await supabase.table("patients").insert(_dump(patient)).execute()
+        created = Patient(**result.data[0])
+
+        # Warm the caches so the follow-up lookups in the same call hit
+        self._patient_cache[created.id] = created
+        if created.phone_number:
+            self._phone_cache[created.phone_number] = created
+
+        return created
+
+    @db_op(default=None)
     async def get_patient(self, patient_id: str) -> Optional[Patient]:
-        """Retrieve a patient by ID."""
-        try:
-            result = self.supabase.table("patients").select("*").eq("id", patient_id).execute()
-            return Patient(**result.data[0]) if result.data else None
-        except Exception as e:
-            logger.error(f"Error getting patient {patient_id}: {str(e)}")
-            return None
-    
+        """Retrieve a patient by ID (coalesced with concurrent lookups)."""
+        row = await self._patient_loader.load(patient_id)
+        return Patient(**row) if row else None
+
+    async def get_patient_cached(self, patient_id: str) -> Optional[Patient]:
+        """Retrieve a patient by ID through the in-process TTL cache."""
+        patient = self._patient_cache.get(patient_id)
+        if patient is not None:
+            return patient
+
+        async with self._cache_lock(f"patient:{patient_id}"):
+            patient = self._patient_cache.get(patient_id)
+            if patient is None:
+                patient = await self.get_patient(patient_id)
+                if patient is not None:
+                    self._patient_cache[patient_id] = patient
+        return patient
+
     async def find_patient_by_phone(self, phone_number: str) -> Optional[Patient]:
-        """Find a patient by phone number."""
-        try:
-            result = self.supabase.table("patients").select("*").eq("phone_number", phone_number).execute()
-            return Patient(**result.data[0]) if result.data else None
-        except Exception as e:
-            logger.error(f"Error finding patient by phone {phone_number}: {str(e)}")
-            return None
-    
+        """Find a patient by phone number, served from cache when possible."""
+        patient = self._phone_cache.get(phone_number)
+        if patient is not None:
+            return patient
+
+        async with self._cache_lock(f"phone:{phone_number}"):
+            patient = self._phone_cache.get(phone_number)
+            if patient is None:
+                patient = await self._find_patient_by_phone(phone_number)
+                if patient is not None:
+                    self._phone_cache[phone_number] = patient
+                    self._patient_cache[patient.id] = patient
+        return patient
+
+    @db_op(default=None)
+    async def _find_patient_by_phone(self, phone_number: str) -> Optional[Patient]:
+        if self._supavisor_dsn:
+            row = await self._fetch_one(
+                f"SELECT {PATIENT_COLS} FROM patients WHERE phone_number = $1 LIMIT 1",
+                phone_number
+            )
+            return Patient(**row) if row else None
+
+        # phone_number is not unique (the 0005 index is plain), so take the
+        # first row rather than maybe_single(), which errors on 2+ matches
+        supabase = await self._client()
+        result = await supabase.table("patients").select(PATIENT_COLS)\
+            .eq("phone_number", phone_number).limit(1).execute()
+        return Patient(**result.data[0]) if result.data else None
+
+    @db_op(default=None)
     async def update_patient(self, patient_id: str, patient_update: PatientUpdate) -> Optional[Patient]:
         """Update a patient's information."""
-        try:
-            update_data = patient_update.dict(exclude_unset=True)
-            update_data['updated_at'] = datetime.utcnow().isoformat()
-            
-            result = self.supabase.table("patients")\
-                .update(update_data)\
-                .eq("id", patient_id)\
-                .execute()
-                
-            return Patient(**result.data[0]) if result.data else None
-        except Exception as e:
-            logger.error(f"Error updating patient {patient_id}: {str(e)}")
-            return None
-    
+        # updated_at goes in after the dump so the string isn't re-encoded
+        update_data = _dump(patient_update, exclude_unset=True)
+        update_data['updated_at'] = _utc_iso_now()
+
+        # When the phone number changes, the old number's cache entry has to
+        # be invalidated too, or find_patient_by_phone(old_number) keeps
+        # resolving the stale Patient for the rest of its TTL
+        old_phone = None
+        if update_data.get('phone_number'):
+            current = self._patient_cache.get(patient_id) or await self.get_patient(patient_id)
+            if current:
+                old_phone = current.phone_number
+
+        supabase = await self._client()
+        result = await supabase.table("patients")\
+            .update(update_data)\
+            .eq("id", patient_id)\
+            .execute()
+
+        self._patient_cache.pop(patient_id, None)
+        if old_phone:
+            self._phone_cache.pop(old_phone, None)
+
+        updated = Patient(**result.data[0]) if result.data else None
+        if updated and updated.phone_number:
+            self._phone_cache.pop(updated.phone_number, None)
+        return updated
+
     # Appointment CRUD Operations
-    async def create_appointment(self, appointment: AppointmentCreate) -> Appointment:
-        """Create a new appointment."""
-        try:
-            result = self.supabase.table("appointments").insert(appointment.dict()).execute()
-            return Appointment(**result.data[0])
-        except Exception as e:
-            logger.error(f"Error creating appointment: {str(e)}")
-            raise
-    
+    @db_op(reraise=True)
+    async def create_appointment(
+        self,
+        appointment: AppointmentCreate,
+        appointment_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Appointment:
+        """
+        Create a new appointment. A caller-supplied ID and extra metadata can
+        be stamped into the row so it lands fully populated in one INSERT.
+        """
+        row = _dump(appointment)
+        if appointment_id:
+            row['id'] = appointment_id
+        if metadata:
+            row['metadata'] = {**(row.get('metadata') or {}), **metadata}
+
+        supabase = await self._client()
+        result = await supabase.table("appointments").insert(row).execute()
+        return Appointment(**result.data[0])
+
+    @db_op(reraise=True)
+    async def create_appointment_batched(self, appointment: AppointmentCreate) -> Appointment:
+        """
+        Create an appointment through the coalescing bulk-insert path.
+        Suited to bursty writers (e.g. an external sync); latency-sensitive
+        call flows should keep using create_appointment.
+        """
+        data = await self._appointment_batcher.add(_dump(appointment))
+        return Appointment(**data)
+
+    @db_op(default=None)
     async def get_appointment(self, appointment_id: str) -> Optional[Appointment]:
         """Retrieve an appointment by ID."""
-        try:
-            result = self.supabase.table("appointments").select("*").eq("id", appointment_id).execute()
-            return Appointment(**result.data[0]) if result.data else None
-        except Exception as e:
-            logger.error(f"Error getting appointment {appointment_id}: {str(e)}")
-            return None
-    
+        if self._supavisor_dsn:
+            row = await self._fetch_one(
+                f"SELECT {APPOINTMENT_COLS} FROM appointments WHERE id = $1",
+                appointment_id
+            )
+            return Appointment(**row) if row else None
+
+        supabase = await self._client()
+        result = await supabase.table("appointments").select(APPOINTMENT_COLS)\
+            .eq("id", appointment_id).maybe_single().execute()
+        row = result.data if result else None
+        return Appointment(**row) if row else None
+
+    @db_op(default=[])
     async def get_patient_appointments(self, patient_id: str, limit: int = 10, upcoming: bool = True) -> List[Appointment]:
         """Get a patient's appointments, optionally filtered by upcoming/past."""
-        try:
-            query = self.supabase.table("appointments").select("*").eq("patient_id", patient_id)
-            
-            if upcoming:
-                query = query.gte("scheduled_time", datetime.utcnow().isoformat())
-            else:
-                query = query.lt("scheduled_time", datetime.utcnow().isoformat())
-                
-            query = query.order("scheduled_time", desc=not upcoming).limit(limit)
-            result = query.execute()
-            
-            return [Appointment(**appt) for appt in result.data]
-        except Exception as e:
-            logger.error(f"Error getting appointments for patient {patient_id}: {str(e)}")
-            return []
-    
+        supabase = await self._client()
+        query = supabase.table("appointments").select(APPOINTMENT_COLS).eq("patient_id", patient_id)
+
+        now_iso = _utc_iso_now()
+        if upcoming:
+            query = query.gte("scheduled_time", now_iso)
+        else:
+            query = query.lt("scheduled_time", now_iso)
+
+        query = query.order("scheduled_time", desc=not upcoming).limit(limit)
+        result = await query.execute()
+
+        return [Appointment(**appt) for appt in result.data]
+
+    @db_op(default=[])
+    async def get_patient_appointments_between(
+        self,
+        patient_id: str,
+        start: datetime,
+        end: datetime
+    ) -> List[Appointment]:
+        """Get a patient's appointments inside a time window, oldest first."""
+        supabase = await self._client()
+        result = await supabase.table("appointments").select(APPOINTMENT_COLS)\
+            .eq("patient_id", patient_id)\
+            .gte("scheduled_time", start.isoformat())\
+            .lte("scheduled_time", end.isoformat())\
+            .order("scheduled_time")\
+            .execute()
+
+        return [Appointment(**appt) for appt in result.data]
+
+    @db_op(default=None)
+    async def aggregate_patient_statuses(self, patient_id: str) -> Optional[Dict[str, int]]:
+        """
+        Count a patient's appointments by status with one server-side
+        GROUP BY; only the per-status tallies come over the wire.
+        """
+        supabase = await self._client()
+        result = await supabase.rpc("count_patient_appointment_statuses", {
+            "p_patient_id": patient_id
+        }).execute()
+
+        return {row["status"]: row["cnt"] for row in result.data}
+
+    @db_op(default=None)
     async def update_appointment(self, appointment_id: str, update: AppointmentUpdate) -> Optional[Appointment]:
         """Update an appointment."""
-        try:
-            update_data = update.dict(exclude_unset=True)
-            update_data['updated_at'] = datetime.utcnow().isoformat()
-            
-            result = self.supabase.table("appointments")\
-                .update(update_data)\
-                .eq("id", appointment_id)\
-                .execute()
-                
-            return Appointment(**result.data[0]) if result.data else None
-        except Exception as e:
-            logger.error(f"Error updating appointment {appointment_id}: {str(e)}")
-            return None
-    
+        update_data = _dump(update, exclude_unset=True)
+        update_data['updated_at'] = _utc_iso_now()
+
+        supabase = await self._client()
+        result = await supabase.table("appointments")\
+            .update(update_data)\
+            .eq("id", appointment_id)\
+            .execute()
+
+        return Appointment(**result.data[0]) if result.data else None
+
+    @db_op(default=[])
+    async def get_doctor_appointments(
+        self,
+        doctor_id: str,
+        start_date: datetime,
+        end_date: datetime,
+        exclude_appointment_id: Optional[str] = None
+    ) -> List[Appointment]:
+        """Get a doctor's scheduled appointments within a time window."""
+        if self._supavisor_dsn:
+            rows = await self._fetch_all(
+                f"SELECT {APPOINTMENT_COLS} FROM appointments"
+                " WHERE doctor_id = $1 AND status = 'scheduled'"
+                " AND scheduled_time >= $2 AND scheduled_time < $3"
+                " AND ($4::uuid IS NULL OR id <> $4)"
+                " ORDER BY scheduled_time",
+                doctor_id, start_date, end_date, exclude_appointment_id
+            )
+            return [Appointment(**row) for row in rows]
+
+        # Keep the filter shape stable and scheduled-only so the partial
+        # covering index on (doctor_id, scheduled_time) satisfies the scan
+        supabase = await self._client()
+        query = supabase.table("appointments").select(APPOINTMENT_COLS)\
+            .eq("doctor_id", doctor_id)\
+            .eq("status", "scheduled")\
+            .gte("scheduled_time", start_date.isoformat())\
+            .lt("scheduled_time", end_date.isoformat())
+
+        if exclude_appointment_id:
+            query = query.neq("id", exclude_appointment_id)
+
+        result = await query.order("scheduled_time").execute()
+
+        return [Appointment(**appt) for appt in result.data]
+
+    @db_op(default=None)
+    async def has_conflict(
+        self,
+        doctor_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        exclude_appointment_id: Optional[str] = None
+    ) -> Optional[bool]:
+        """
+        Check for an overlapping scheduled appointment with a single indexed
+        EXISTS query; no rows come over the wire. Returns None on error.
+        """
+        supabase = await self._client()
+        result = await supabase.rpc("has_scheduling_conflict", {
+            "p_doctor_id": doctor_id,
+            "p_start": start_time.isoformat(),
+            "p_end": end_time.isoformat(),
+            "p_exclude_id": exclude_appointment_id
+        }).execute()
+
+        return bool(result.data)
+
+    @db_op(default=None)
+    async def update_appointment_status(
+        self,
+        appointment_id: str,
+        status: str,
+        notes_append: Optional[str] = None
+    ) -> Optional[Appointment]:
+        """
+        Change an appointment's status in a single guarded UPDATE ... RETURNING.
+
+        The transition is validated server-side (only scheduled rows match),
+        so callers check the returned row instead of pre-reading the status.
+        """
+        supabase = await self._client()
+        result = await supabase.rpc("update_appointment_status", {
+            "p_appointment_id": appointment_id,
+            "p_status": status,
+            "p_notes_append": notes_append
+        }).execute()
+
+        return Appointment(**result.data[0]) if result.data else None
+
+    @db_op(default=False)
+    async def merge_appointment_metadata(self, appointment_id: str, patch: Dict[str, Any]) -> bool:
+        """
+        Merge a patch into an appointment's metadata with a server-side
+        JSONB concatenation; no read of the current metadata is needed and
+        concurrent patches cannot clobber each other.
+        """
+        supabase = await self._client()
+        await supabase.rpc("merge_appointment_metadata", {
+            "p_appointment_id": appointment_id,
+            "p_patch": patch
+        }).execute()
+        return True
+
+    @db_op(default=False)
     async def cancel_appointment(self, appointment_id: str) -> bool:
         """Cancel an appointment."""
-        try:
-            from models import AppointmentStatus
-            
-            result = self.supabase.table("appointments")\
-                .update({
-                    'status': AppointmentStatus.CANCELLED,
-                    'updated_at': datetime.utcnow().isoformat()
-                })\
-                .eq("id", appointment_id)\
-                .execute()
-                
-            return len(result.data) > 0
-        except Exception as e:
-            logger.error(f"Error cancelling appointment {appointment_id}: {str(e)}")
-            return False
-    
+        from models import AppointmentStatus
+
+        supabase = await self._client()
+        result = await supabase.table("appointments")\
+            .update({
+                'status': AppointmentStatus.CANCELLED,
+                'updated_at': _utc_iso_now()
+            })\
+            .eq("id", appointment_id)\
+            .execute()
+
+        return len(result.data) > 0
+
     # Doctor Operations
+    @db_op(default=None)
     async def get_doctor(self, doctor_id: str) -> Optional[Doctor]:
-        """Retrieve a doctor by ID."""
-        try:
-            result = self.supabase.table("doctors").select("*").eq("id", doctor_id).execute()
-            return Doctor(**result.data[0]) if result.data else None
-        except Exception as e:
-            logger.error(f"Error getting doctor {doctor_id}: {str(e)}")
-            return None
+        """Retrieve a doctor by ID (coalesced with concurrent lookups)."""
+        row = await self._doctor_loader.load(doctor_id)
+        return Doctor(**row) if row else None
+
+    async def get_doctor_cached(self, doctor_id: str) -> Optional[Doctor]:
+        """Retrieve a doctor by ID through the in-process TTL cache."""
+        doctor = self._doctor_cache.get(doctor_id)
+        if doctor is not None:
+            return doctor
+
+        async with self._cache_lock(f"doctor:{doctor_id}"):
+            doctor = self._doctor_cache.get(doctor_id)
+            if doctor is None:
+                doctor = await self.get_doctor(doctor_id)
+                if doctor is not None:
+                    self._doctor_cache[doctor_id] = doctor
+        return doctor
 
 # Initialize database service
 db = DatabaseService()
@@ -1,4 +1,5 @@
-import json
+import orjson
+from functools import cached_property
 from pathlib import Path
 from typing import Dict, Any, Optional
 from loguru import logger
@@ -13,12 +14,11 @@ class KnowledgeBaseManager:
         """Load clinic information from JSON file."""
         clinic_info_path = self.knowledge_base_dir / "clinic_info.json"
         try:
-            with open(clinic_info_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return orjson.loads(clinic_info_path.read_bytes())
         except FileNotFoundError:
             logger.warning(f"Clinic info not found at {clinic_info_path}")
             return {}
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error parsing clinic info JSON: {e}")
             return {}
     
@@ -53,50 +53,56 @@ class KnowledgeBaseManager:
         """Get frequently asked questions and answers."""
         return self.clinic_info.get('faqs', [])
     
-    def generate_context_prompt(self) -> str:
-        """Generate a context prompt for the AI with clinic information."""
-        if not self.clinic_info:
+    @cached_property
+    def context_prompt(self) -> str:
+        """The AI context prompt, built once per load of clinic_info."""
+        info = self.clinic_info
+        if not info:
             return ""
-        
-        context_parts = [
-            f"You are an AI assistant for {self.clinic_info.get('clinic_name', 'our clinic')}.",
-            f"Clinic Address: {self.clinic_info.get('address')}",
-            f"Phone: {self.clinic_info.get('phone')}",
-            "\nOperating Hours:"
+
+        sections = [
+            f"You are an AI assistant for {info.get('clinic_name', 'our clinic')}.",
+            f"Clinic Address: {info.get('address')}",
+            f"Phone: {info.get('phone')}",
+            "\nOperating Hours:",
+            "\n".join(
+                f"- {day.capitalize()}: {hours}"
+                for day, hours in info.get('hours', {}).items()
+            ),
         ]
-        
-        # Add operating hours
-        for day, hours in self.clinic_info.get('hours', {}).items():
-            context_parts.append(f"- {day.capitalize()}: {hours}")
-        
-        # Add services
-        if 'services' in self.clinic_info:
-            context_parts.append("\nServices we offer:")
-            for service in self.clinic_info['services']:
-                context_parts.append(f"- {service}")
-        
-        # Add doctors
-        if 'doctors' in self.clinic_info:
-            context_parts.append("\nOur Doctors:")
-            for doctor in self.clinic_info['doctors']:
-                context_parts.append(
-                    f"- {doctor['name']} ({doctor['specialty']}): {doctor['bio']}"
-                )
-        
-        # Add insurance info
-        if 'insurance_accepted' in self.clinic_info:
-            context_parts.append(
-                f"\nWe accept the following insurance: {', '.join(self.clinic_info['insurance_accepted'])}"
+
+        if 'services' in info:
+            sections.append("\nServices we offer:\n" + "\n".join(
+                f"- {service}" for service in info['services']
+            ))
+
+        if 'doctors' in info:
+            sections.append("\nOur Doctors:\n" + "\n".join(
+                f"- {doctor['name']} ({doctor['specialty']}): {doctor['bio']}"
+                for doctor in info['doctors']
+            ))
+
+        if 'insurance_accepted' in info:
+            sections.append(
+                f"\nWe accept the following insurance: {', '.join(info['insurance_accepted'])}"
             )
-        
-        # Add FAQs
-        if 'faqs' in self.clinic_info and self.clinic_info['faqs']:
-            context_parts.append("\nFrequently Asked Questions:")
-            for faq in self.clinic_info['faqs']:
-                context_parts.append(f"Q: {faq['question']}")
-                context_parts.append(f"A: {faq['answer']}\n")
-        
-        return "\n".join(context_parts)
+
+        if info.get('faqs'):
+            sections.append("\nFrequently Asked Questions:\n" + "\n".join(
+                f"Q: {faq['question']}\nA: {faq['answer']}\n"
+                for faq in info['faqs']
+            ))
+
+        return "\n".join(sections)
+
+    def generate_context_prompt(self) -> str:
+        """Generate a context prompt for the AI with clinic information."""
+        return self.context_prompt
+
+    def reload(self) -> None:
+        """Re-read clinic info from disk and invalidate the cached prompt."""
+        self.clinic_info = self._load_clinic_info()
+        self.__dict__.pop('context_prompt', None)
 
 # Singleton instance
 knowledge_base = KnowledgeBaseManager()
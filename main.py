@@ -1,9 +1,10 @@
 import os
 import logging
+import re
 import google.generativeai as genai
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse, HTMLResponse
+from fastapi.responses import PlainTextResponse, HTMLResponse, ORJSONResponse
 from typing import Dict, Optional
 from pydantic import BaseModel
 from typing import Dict, Optional
@@ -19,9 +20,11 @@ from livekit.agents.tts import TTS
 from livekit.agents.stt import STT
 from livekit.plugins import deepgram
 import asyncio
+from datetime import datetime
 from dotenv import load_dotenv
 import uuid
-from plivo import RestClient
+import httpx
+from cachetools import TTLCache
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -34,14 +37,19 @@ logger = logging.getLogger("syraa")
 # Load environment variables
 load_dotenv()
 
-# XML Templates
-XML_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Dial callerId="SYRAA" record="false">
-        <User>sip:livekit-{call_uuid}@sip.plivo.com;transport=tcp</User>
-    </Dial>
-</Response>
-"""
+# XML template, pre-split around the call UUID so the webhook hot path
+# joins three byte strings instead of running str.format
+XML_PREFIX = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<Response>\n'
+    b'    <Dial callerId="SYRAA" record="false">\n'
+    b'        <User>sip:livekit-'
+)
+XML_SUFFIX = (
+    b'@sip.plivo.com;transport=tcp</User>\n'
+    b'    </Dial>\n'
+    b'</Response>\n'
+)
 
 # This XML tells Plivo to connect the call to your LiveKit SIP trunk
 # The call will be routed to the room specified in LiveKit's SIP configuration
@@ -50,8 +58,8 @@ XML_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
 # Note: The {call_uuid} ensures each call gets a unique SIP username
 # Make sure you've set up a SIP trunk in LiveKit and configured the SIP endpoint in Plivo
 
-# Initialize FastAPI app
-app = FastAPI()
+# Initialize FastAPI app; orjson encodes responses 2-5x faster than stdlib json
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -78,8 +86,30 @@ except Exception as e:
     logger.error(f"Failed to initialize Gemini model: {e}")
     raise
 
-# Store active calls
-active_calls = {}
+# Number a call is forwarded to when the agent hands off to a human
+FALLBACK_PHONE_NUMBER = os.getenv("FALLBACK_PHONE_NUMBER")
+
+# Deepgram clients are created once per worker process: they hold HTTP/
+# WebSocket connection pools whose keep-alive state would be thrown away
+# if they were rebuilt for every incoming call
+DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
+_TTS = None
+_STT = None
+if DEEPGRAM_API_KEY:
+    _TTS = deepgram.TTS(
+        api_key=DEEPGRAM_API_KEY,
+        voice="nova",  # or "shimmer" for a different voice
+        model="aura-asteria-en"  # or other Deepgram models
+    )
+    _STT = deepgram.STT(api_key=DEEPGRAM_API_KEY)
+
+# Keep-alive HTTP client for Plivo REST calls, shared by all agents in the
+# worker; reusing connections avoids a TLS handshake per transfer and never
+# blocks the loop. Module-level because an agent is built per call.
+_HTTP = httpx.AsyncClient(
+    timeout=5,
+    limits=httpx.Limits(max_keepalive_connections=20)
+)
 
 class CallStatus:
     CONNECTED = "connected"
@@ -122,6 +152,38 @@ class CallResponse(BaseModel):
 def generate_call_sid() -> str:
     return str(uuid.uuid4())
 
+# Sentence boundary used to chunk streamed LLM text for TTS
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+# Phrases in an LLM reply that trigger a hand-off to a human agent;
+# one case-insensitive scan instead of lowercasing the whole response
+# and running three substring searches
+TRANSFER_RE = re.compile(r"human|agent|can't help", re.IGNORECASE)
+
+async def _iter_sentences(source):
+    """
+    Yield sentence-sized chunks of text from either a plain string or an
+    async iterable of partial text chunks (e.g. a streaming LLM response).
+    """
+    if isinstance(source, str):
+        for sentence in _SENTENCE_BOUNDARY.split(source):
+            if sentence.strip():
+                yield sentence
+        return
+
+    buffer = ""
+    async for chunk in source:
+        buffer += chunk
+        parts = _SENTENCE_BOUNDARY.split(buffer)
+        # The last part may be an incomplete sentence; keep buffering it
+        buffer = parts.pop()
+        for sentence in parts:
+            if sentence.strip():
+                yield sentence
+
+    if buffer.strip():
+        yield buffer
+
 # Helper function to generate LiveKit token
 def generate_livekit_token(identity: str) -> str:
     """Generate LiveKit token for telephony integration"""
@@ -194,21 +256,16 @@ async def health_check():
 @app.get("/plivo/answer/")
 async def plivo_answer(request: Request):
     """Handle Plivo answer webhook"""
-    # Get call data from query parameters
-    call_data = dict(request.query_params)
-    call_uuid = call_data.get('CallUUID', '')
-    
-    # Generate XML response with call UUID
-    xml = XML_RESPONSE.format(
-        call_uuid=call_uuid
-    )
-    
+    # Only the CallUUID is needed; skip copying the whole QueryParams dict
+    call_uuid = request.query_params.get('CallUUID', '')
+
     logger.info(f"Plivo answer webhook received for call {call_uuid}")
-    logger.debug(f"Call data: {call_data}")
-    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Call data: {dict(request.query_params)}")
+
     # Return XML response with correct content type
     return Response(
-        content=xml,
+        content=XML_PREFIX + call_uuid.encode("ascii") + XML_SUFFIX,
         media_type="application/xml",
         headers={
             "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -233,24 +290,27 @@ async def plivo_hangup(request: Request):
 # LiveKit Agent for handling SIP calls
 class SyraaAgent:
     def __init__(self):
-        # Get Deepgram API key from environment
-        deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
-        if not deepgram_api_key:
+        if _TTS is None or _STT is None:
             raise ValueError("DEEPGRAM_API_KEY environment variable not set")
-            
-        # Initialize Deepgram TTS
-        self.tts = deepgram.TTS(
-            api_key=deepgram_api_key,
-            voice="nova",  # or "shimmer" for a different voice
-            model="aura-asteria-en"  # or other Deepgram models
-        )
-        
-        # Initialize Deepgram STT
-        self.stt = deepgram.STT(api_key=deepgram_api_key)
-        
-        # Store active calls
-        self.active_calls = {}
+
+        # Share the worker-wide Deepgram clients across calls
+        self.tts = _TTS
+        self.stt = _STT
         
+        # Active calls, TTL-bounded so an exit path that skips cleanup
+        # cannot leak Room/Participant references for the process lifetime
+        self.active_calls = TTLCache(maxsize=10_000, ttl=3600)
+
+        # The agent's published TTS track, created once per call
+        self._agent_track = None
+
+        # Per-call audio->STT pipeline, opened once and reused by listen()
+        self._audio_stream = None
+        self._stt_stream = None
+
+        # Worker-wide keep-alive HTTP client for Plivo REST calls
+        self._http = _HTTP
+
         logger.info("SyraaAgent initialized with Deepgram TTS/STT")
 
     async def process_call(self, ctx: JobContext):
@@ -266,25 +326,75 @@ class SyraaAgent:
             await ctx.connect()
             logger.info("Connected to LiveKit room")
             
-            # Get the participant (caller) - wait briefly for them to connect
-            max_retries = 5
-            participant = None
-            for _ in range(max_retries):
-                for p in room.participants.values():
-                    if p.identity != "agent":  # Skip the agent itself
-                        participant = p
-                        break
-                if participant:
-                    break
+            # Get the participant (caller) - wake on the join event instead
+            # of polling, but check once first for the race where they
+            # joined before connect() returned
+            participant = next(
+                (p for p in room.participants.values() if p.identity != "agent"),
+                None
+            )
+
+            if not participant:
+                joined = asyncio.Event()
+                participant_ref = []
+
+                @room.on("participant_connected")
+                def _on_participant_connected(p):
+                    if p.identity != "agent" and not participant_ref:
+                        participant_ref.append(p)
+                        joined.set()
+
                 logger.info("Waiting for participant to connect...")
-                await asyncio.sleep(1)
-            
+                try:
+                    await asyncio.wait_for(joined.wait(), timeout=5)
+                    participant = participant_ref[0]
+                except asyncio.TimeoutError:
+                    pass
+
             if not participant:
-                logger.error("No participant found in the room after retries")
+                logger.error("No participant joined the room within 5s")
                 return
                 
             logger.info(f"Found participant: {participant.identity}")
-            
+
+            # Publish the agent's TTS track once; say() pushes frames into it
+            # for the lifetime of the call, so each utterance skips the SDP
+            # renegotiation that publish/unpublish per utterance would cost
+            self._agent_track = rtc.AudioTrack.create_audio_track(
+                "agent_audio",
+                sample_rate=24000,
+                num_channels=1
+            )
+            await room.local_participant.publish_track(self._agent_track)
+
+            # Open one STT session for the whole call: each Deepgram
+            # recognize stream costs a handshake, and re-subscribing to the
+            # audio track per turn drops packets at the boundary
+            audio_track = next(
+                (t for t in participant.tracks.values()
+                 if t.kind == rtc.TrackKind.KIND_AUDIO),
+                None
+            )
+            if not audio_track:
+                logger.error("No audio track found for participant")
+                return
+
+            self._audio_stream = rtc.AudioStream(
+                sample_rate=16000,
+                num_channels=1,
+                samples_per_channel=320  # 20ms at 16kHz
+            )
+            audio_track.add_subscriber(self._audio_stream)
+
+            self._stt_stream = self.stt.recognize(
+                self._audio_stream,
+                language="en-US",
+                interim_results=True,
+                punctuate=True,
+                endpointing=300,
+                model="nova-2"
+            )
+
             # Store the call
             self.active_calls[call_sid] = {
                 "participant": participant,
@@ -310,129 +420,96 @@ class SyraaAgent:
                     continue
                 failed_attempts = 0
                 logger.info(f"User said: {user_text}")
-                
-                # Get response from Gemini
-                response = await self.get_gemini_response(user_text)
-                
-                if "human" in response.lower() or "agent" in response.lower() or "can't help" in response.lower():
+
+                # Stream Gemini's response straight into TTS so synthesis
+                # overlaps generation instead of waiting for the full reply
+                response = await self.say(self.get_gemini_response(user_text), participant)
+
+                if TRANSFER_RE.search(response):
                     await self.say("Transferring you to a human agent.", participant)
                     await self.transfer_to_human(participant)
                     break
                 
-                # Speak the response
-                await self.say(response, participant)
-                
         except Exception as e:
             logger.error(f"Error in call processing: {e}", exc_info=True)
             raise
         finally:
             # Clean up
             logger.info(f"Ending call {call_sid}")
-            if call_sid in self.active_calls:
-                del self.active_calls[call_sid]
+            self.active_calls.pop(call_sid, None)
+            if self._agent_track is not None:
+                await self._agent_track.stop()
+                self._agent_track = None
+            self._stt_stream = None
+            self._audio_stream = None
             if room:
                 await room.disconnect()
             logger.info("Call processing completed")
     
-    async def say(self, text: str, participant):
-        """Convert text to speech and play it to the participant using Deepgram TTS"""
+    async def say(self, text, participant) -> str:
+        """
+        Convert text to speech and play it to the participant using Deepgram
+        TTS. Accepts a plain string or an async iterable of text chunks; a
+        stream is synthesized sentence by sentence so speech starts before
+        the full reply has been generated. Frames are pushed into the call's
+        long-lived published track. Returns the full spoken text.
+        """
         if not text:
-            return
-            
+            return ""
+
+        if self._agent_track is None:
+            logger.error("No published agent track; cannot speak")
+            return ""
+
+        spoken = []
         try:
-            # Generate speech with Deepgram TTS
-            tts_stream = self.tts.synthesize(text)
-            
-            # Create audio track
-            track = rtc.AudioTrack.create_audio_track(
-                "agent_audio",
-                sample_rate=tts_stream.sample_rate,
-                num_channels=tts_stream.num_channels
-            )
-            
-            # Publish the track
-            publication = await participant.publish_track(track)
-            
-            # Stream the audio
-            async for audio in tts_stream:
-                track.push_frame(audio.frame)
-                
+            async for sentence in _iter_sentences(text):
+                spoken.append(sentence)
+
+                # Generate speech with Deepgram TTS and stream the audio
+                tts_stream = self.tts.synthesize(sentence)
+                async for audio in tts_stream:
+                    self._agent_track.push_frame(audio.frame)
+
             # Wait a bit for the audio to finish playing
             await asyncio.sleep(0.5)
-            
-            # Clean up
-            await track.stop()
-            
+
         except Exception as e:
             logger.error(f"Error in TTS: {e}", exc_info=True)
+
+        return " ".join(spoken)
     
     async def listen(self, participant, timeout: float = 10.0) -> Optional[str]:
-        """Listen for user speech and convert to text using Deepgram STT"""
+        """Pull the next final utterance from the call's persistent STT stream"""
+        if self._stt_stream is None:
+            logger.error("No STT stream open for this call")
+            return None
+
         try:
-            # Get the participant's audio track
-            audio_track = None
-            for track in participant.tracks.values():
-                if track.kind == rtc.TrackKind.KIND_AUDIO:
-                    audio_track = track
-                    break
-                    
-            if not audio_track:
-                logger.error("No audio track found for participant")
-                return None
-            
-            # Create an audio stream
-            audio_stream = rtc.AudioStream(
-                sample_rate=16000,
-                num_channels=1,
-                samples_per_channel=320  # 20ms at 16kHz
-            )
-            
-            # Subscribe to the participant's audio track
-            audio_track.add_subscriber(audio_stream)
-            
-            # Create STT stream
-            stt_stream = self.stt.recognize(
-                audio_stream,
-                language="en-US",
-                interim_results=True,
-                punctuate=True,
-                model="nova-2"
-            )
-            
-            # Process STT results with timeout
-            try:
-                start_time = asyncio.get_event_loop().time()
-                
-                async for result in stt_stream:
-                    # Check timeout
-                    if asyncio.get_event_loop().time() - start_time > timeout:
-                        logger.info("Listening timed out")
-                        return None
-                        
-                    if result.is_final and result.text.strip():
-                        return result.text
-                        
-                return None
-                
-            except asyncio.TimeoutError:
-                logger.info("Listening timed out")
-                return None
-                
+            return await asyncio.wait_for(self._next_final_utterance(), timeout)
+        except asyncio.TimeoutError:
+            logger.info("Listening timed out")
+            return None
         except Exception as e:
             logger.error(f"Error in STT: {e}", exc_info=True)
             return None
+
+    async def _next_final_utterance(self) -> Optional[str]:
+        async for result in self._stt_stream:
+            if result.is_final and result.text.strip():
+                return result.text
+        return None
     
-    async def get_gemini_response(self, prompt: str) -> str:
-        """Get response from Gemini"""
+    async def get_gemini_response(self, prompt: str):
+        """Stream Gemini's response as text chunks."""
         try:
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: gemini_model.generate_content(prompt)
-            )
-            return response.text or "I'm sorry, I didn't catch that. Could you please repeat?"
+            response = await gemini_model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
         except Exception as e:
             logger.error(f"Error getting response from Gemini: {e}")
-            return "I'm sorry, I'm having trouble understanding. Could you please repeat that?"
+            yield "I'm sorry, I'm having trouble understanding. Could you please repeat that?"
 
     async def transfer_to_human(self, participant):
         """Transfer the call to a human agent using Plivo."""
@@ -441,14 +518,20 @@ class SyraaAgent:
             await self.say("Sorry, no human agent is available at the moment.", participant)
             return
         try:
-            client = RestClient(auth_id=os.getenv("PLIVO_AUTH_ID"), auth_token=os.getenv("PLIVO_AUTH_TOKEN"))
-            response = client.calls.create(
-                from_=os.getenv("PLIVO_PHONE_NUMBER"),
-                to=FALLBACK_PHONE_NUMBER,
-                answer_url="https://s3.amazonaws.com/static.plivo.com/answer.xml",
-                answer_method="GET"
+            auth_id = os.getenv("PLIVO_AUTH_ID")
+            response = await self._http.post(
+                f"https://api.plivo.com/v1/Account/{auth_id}/Call/",
+                auth=(auth_id, os.getenv("PLIVO_AUTH_TOKEN")),
+                json={
+                    "from": os.getenv("PLIVO_PHONE_NUMBER"),
+                    "to": FALLBACK_PHONE_NUMBER,
+                    "answer_url": "https://s3.amazonaws.com/static.plivo.com/answer.xml",
+                    "answer_method": "GET"
+                }
             )
-            logger.info(f"Transferred call to human agent: [REDACTED], Plivo call UUID: {response['request_uuid']}")
+            response.raise_for_status()
+            request_uuid = response.json().get("request_uuid")
+            logger.info(f"Transferred call to human agent: [REDACTED], Plivo call UUID: {request_uuid}")
         except Exception as e:
             logger.error(f"Failed to transfer call to human agent: {e}")
             await self.say("Sorry, we could not connect you to a human agent. Please try again later.", participant)
@@ -462,14 +545,13 @@ async def entrypoint(ctx: JobContext):
 # Run the worker if this file is executed directly
 if __name__ == "__main__":
     import sys
-    import threading
     import uvicorn
-    
+
     # Create worker options
     worker_options = WorkerOptions(
         entrypoint_fnc=entrypoint,
     )
-    
+
     # In production, you would typically run the worker separately from the API
     # For development, we'll run both in the same process
     if "--worker" in sys.argv:
@@ -478,17 +560,32 @@ if __name__ == "__main__":
         sys.argv = [sys.argv[0], 'start']
         cli.run_app(worker_options)
     else:
-        # For development, run both FastAPI and worker
+        # For development, run FastAPI and the worker as coroutines on one
+        # asyncio loop instead of two loops in separate threads contending
+        # for the GIL
         print("Starting in development mode...")
-        
-        # Start FastAPI in a separate thread
-        def run_fastapi():
-            uvicorn.run(app, host="0.0.0.0", port=8080, log_level="info")
-        
-        fastapi_thread = threading.Thread(target=run_fastapi, daemon=True)
-        fastapi_thread.start()
-        
-        # Run the worker in the main thread with dev command
-        print("Starting LiveKit worker in development mode...")
-        sys.argv = [sys.argv[0], 'dev']
-        cli.run_app(worker_options)
\ No newline at end of file
+
+        async def _dev_main():
+            config = uvicorn.Config(
+                app,
+                host="0.0.0.0",
+                port=8080,
+                log_level="info",
+                loop="uvloop",
+                http="httptools",
+                # The access log writes to stderr synchronously per request
+                access_log=False,
+            )
+            server = uvicorn.Server(config)
+            worker = Worker(worker_options)
+            await asyncio.gather(server.serve(), worker.run())
+
+        # Install uvloop before the loop is created; a running loop can't
+        # be swapped, so uvicorn's loop= option alone wouldn't apply here
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+
+        asyncio.run(_dev_main())
\ No newline at end of file
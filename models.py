@@ -1,8 +1,9 @@
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field, EmailStr, validator
+from pydantic import BaseModel, Field, EmailStr, PrivateAttr, validator
 from enum import Enum
 from datetime import time
+from utils import normalize_phone_number
 
 class PatientStatus(str, Enum):
     NEW = "new"
@@ -14,7 +15,8 @@ class AppointmentStatus(str, Enum):
     CONFIRMED = "confirmed"
     CANCELLED = "cancelled"
     COMPLETED = "completed"
-    NO_SHOW = "no_show"n
+    NO_SHOW = "no_show"
+
 class PatientBase(BaseModel):
     phone_number: str = Field(..., description="Patient's primary phone number")
     full_name: Optional[str] = Field(None, description="Patient's full name")
@@ -26,10 +28,23 @@ class PatientBase(BaseModel):
     
     @validator('phone_number')
     def validate_phone_number(cls, v):
-        # Basic phone number validation (can be enhanced)
-        if not v.startswith('+'):
-            raise ValueError('Phone number must include country code (e.g., +1...)')
-        return v
+        # Full libphonenumber validation, normalized to E.164 here so
+        # downstream code never needs to re-validate or re-format
+        if v is None:
+            return v
+        normalized = normalize_phone_number(v)
+        if normalized is None:
+            raise ValueError('Invalid phone number')
+        return normalized
+
+    class Config:
+        # Drop unknown columns instead of storing them, strip whitespace once
+        # at the boundary, and skip the deep copy pydantic otherwise makes of
+        # nested models during validation -- these models are hydrated per DB
+        # row, so construction cost is the hot path
+        extra = 'ignore'
+        anystr_strip_whitespace = True
+        copy_on_model_validation = 'none'
 
 class PatientCreate(PatientBase):
     pass
@@ -41,8 +56,8 @@ class Patient(PatientBase):
     id: str = Field(..., description="Unique patient identifier")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
-    
-    class Config:
+
+    class Config(PatientBase.Config):
         from_attributes = True
 
 class AppointmentBase(BaseModel):
@@ -55,6 +70,11 @@ class AppointmentBase(BaseModel):
     notes: Optional[str] = Field(None, description="Additional notes")
     metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional appointment data")
 
+    class Config:
+        extra = 'ignore'
+        anystr_strip_whitespace = True
+        copy_on_model_validation = 'none'
+
 class AppointmentCreate(AppointmentBase):
     pass
 
@@ -69,8 +89,8 @@ class Appointment(AppointmentBase):
     id: str = Field(..., description="Unique appointment identifier")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
-    
-    class Config:
+
+    class Config(AppointmentBase.Config):
         from_attributes = True
 
 class Doctor(BaseModel):
@@ -82,3 +102,29 @@ class Doctor(BaseModel):
         description="Working hours by weekday, e.g., {'monday': [{'start': '09:00', 'end': '17:00'}]}"
     )
     calendar_id: Optional[str] = Field(None, description="Google Calendar ID for the doctor")
+
+    _wh_by_weekday: Optional[tuple] = PrivateAttr(default=None)
+
+    class Config:
+        extra = 'ignore'
+        copy_on_model_validation = 'none'
+
+    def working_hours_by_weekday(self) -> tuple:
+        """
+        Working hours as a 7-tuple indexed by weekday (0=Monday), each entry a
+        tuple of (start, end) pairs in seconds since midnight. Parsed once per
+        loaded Doctor so hot loops can compare plain ints instead of re-doing
+        the weekday-name/dict lookups on every call.
+        """
+        if self._wh_by_weekday is None:
+            day_names = ('monday', 'tuesday', 'wednesday', 'thursday',
+                         'friday', 'saturday', 'sunday')
+            self._wh_by_weekday = tuple(
+                tuple(
+                    (r['start'].hour * 3600 + r['start'].minute * 60 + r['start'].second,
+                     r['end'].hour * 3600 + r['end'].minute * 60 + r['end'].second)
+                    for r in self.working_hours.get(day, [])
+                )
+                for day in day_names
+            )
+        return self._wh_by_weekday
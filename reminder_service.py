@@ -1,8 +1,13 @@
+import asyncio
 import os
+from functools import lru_cache
 from plivo import RestClient
 from datetime import datetime
 import logging
 
+import httpx
+import requests.adapters
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("reminder_service")
@@ -13,29 +18,135 @@ PLIVO_WHATSAPP_NUMBER = os.getenv("PLIVO_PHONE_NUMBER")  # Your Plivo WhatsApp-e
 
 client = RestClient(auth_id=PLIVO_AUTH_ID, auth_token=PLIVO_AUTH_TOKEN)
 
+# Pool connections on the SDK's underlying session so a reminder batch reuses
+# TCP+TLS connections instead of handshaking per message. No adapter-level
+# retries: retrying is owned by the callers' retry_with_backoff layer, and
+# stacking the two would multiply attempts against a dead endpoint
+_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+)
+client.session.mount('https://', _adapter)
+
+_PLIVO_MESSAGE_URL = f"https://api.plivo.com/v1/Account/{PLIVO_AUTH_ID}/Message/"
+
+# Approved WhatsApp template name; when set, reminders go out as template
+# messages (server-side parameter substitution, exempt from Meta's 24-hour
+# session rule) instead of free-form text
+PLIVO_WHATSAPP_TEMPLATE = os.getenv("PLIVO_WHATSAPP_TEMPLATE")
+
+@lru_cache(maxsize=1024)
+def _reminder_time_str(appointment_time: datetime) -> str:
+    """
+    Human-readable appointment time, cached so a bulk blast formats each
+    distinct slot once instead of running strftime per recipient.
+    """
+    return appointment_time.strftime('%A, %d %B %Y at %I:%M %p')
+
+def _reminder_template(time_str: str, patient_name: str, doctor_name: str = None) -> dict:
+    # WhatsApp rejects empty template parameters, so doctor-less reminders
+    # substitute a neutral phrase instead of an empty string
+    doctor_part = f"with Dr. {doctor_name}" if doctor_name else "at the clinic"
+    return {
+        'name': PLIVO_WHATSAPP_TEMPLATE,
+        'language': 'en',
+        'components': [{
+            'type': 'body',
+            'parameters': [
+                {'type': 'text', 'text': patient_name},
+                {'type': 'text', 'text': doctor_part},
+                {'type': 'text', 'text': time_str},
+            ],
+        }],
+    }
+
 def send_whatsapp_reminder(to_number: str, appointment_time: datetime, patient_name: str, doctor_name: str = None):
     """
-    Send a WhatsApp reminder for an appointment using Plivo. Returns True if sent, False otherwise.
+    Send a WhatsApp reminder for an appointment using Plivo. Returns True if
+    sent; raises on failure so callers can decide which errors to retry.
     """
     if not (PLIVO_AUTH_ID and PLIVO_AUTH_TOKEN and PLIVO_WHATSAPP_NUMBER):
-        logger.error("Plivo credentials or WhatsApp number not set in environment variables.")
-        return False
+        raise RuntimeError("Plivo credentials or WhatsApp number not set in environment variables.")
     # Format the message
-    time_str = appointment_time.strftime('%A, %d %B %Y at %I:%M %p')
-    doctor_part = f" with Dr. {doctor_name}" if doctor_name else ""
-    message = (
-        f"Hello {patient_name}, this is a reminder for your upcoming appointment{doctor_part} "
-        f"on {time_str}. If you need to reschedule or cancel, please reply to this message."
-    )
-    for attempt in range(2):
-        try:
-            response = client.messages.create(
-                src=f"whatsapp:{PLIVO_WHATSAPP_NUMBER}",
-                dst=f"whatsapp:{to_number}",
-                text=message
-            )
-            logger.info(f"WhatsApp reminder sent to {to_number}: {response.message_uuid}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to send WhatsApp reminder to {to_number} (attempt {attempt+1}): {e}")
-    return False 
\ No newline at end of file
+    time_str = _reminder_time_str(appointment_time)
+    if PLIVO_WHATSAPP_TEMPLATE:
+        response = client.messages.create(
+            src=f"whatsapp:{PLIVO_WHATSAPP_NUMBER}",
+            dst=f"whatsapp:{to_number}",
+            type='whatsapp',
+            template=_reminder_template(time_str, patient_name, doctor_name)
+        )
+    else:
+        doctor_part = f" with Dr. {doctor_name}" if doctor_name else ""
+        message = (
+            f"Hello {patient_name}, this is a reminder for your upcoming appointment{doctor_part} "
+            f"on {time_str}. If you need to reschedule or cancel, please reply to this message."
+        )
+        response = client.messages.create(
+            src=f"whatsapp:{PLIVO_WHATSAPP_NUMBER}",
+            dst=f"whatsapp:{to_number}",
+            text=message
+        )
+    logger.info(f"WhatsApp reminder sent to {to_number}: {response.message_uuid}")
+    return True
+
+async def _send_whatsapp_reminder_async(
+    http: httpx.AsyncClient,
+    to_number: str,
+    appointment_time: datetime,
+    patient_name: str,
+    doctor_name: str = None,
+) -> bool:
+    """
+    Send one WhatsApp reminder over a shared httpx client. Same message as
+    send_whatsapp_reminder, but non-blocking so a batch can run concurrently.
+    """
+    time_str = _reminder_time_str(appointment_time)
+    payload = {
+        "src": f"whatsapp:{PLIVO_WHATSAPP_NUMBER}",
+        "dst": f"whatsapp:{to_number}",
+    }
+    if PLIVO_WHATSAPP_TEMPLATE:
+        payload["type"] = "whatsapp"
+        payload["template"] = _reminder_template(time_str, patient_name, doctor_name)
+    else:
+        doctor_part = f" with Dr. {doctor_name}" if doctor_name else ""
+        payload["text"] = (
+            f"Hello {patient_name}, this is a reminder for your upcoming appointment{doctor_part} "
+            f"on {time_str}. If you need to reschedule or cancel, please reply to this message."
+        )
+    try:
+        response = await http.post(
+            _PLIVO_MESSAGE_URL,
+            auth=(PLIVO_AUTH_ID, PLIVO_AUTH_TOKEN),
+            json=payload,
+        )
+        response.raise_for_status()
+        logger.info(f"WhatsApp reminder sent to {to_number}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send WhatsApp reminder to {to_number}: {e}")
+        return False
+
+async def send_whatsapp_reminders_bulk(reminders) -> list:
+    """
+    Send a batch of WhatsApp reminders concurrently.
+
+    Args:
+        reminders: iterable of (to_number, appointment_time, patient_name,
+            doctor_name) tuples; doctor_name may be omitted.
+
+    Returns:
+        List of booleans, one per reminder, in input order. A blast of N
+        reminders completes in roughly one round-trip instead of N.
+    """
+    if not (PLIVO_AUTH_ID and PLIVO_AUTH_TOKEN and PLIVO_WHATSAPP_NUMBER):
+        logger.error("Plivo credentials or WhatsApp number not set in environment variables.")
+        return [False for _ in reminders]
+    async with httpx.AsyncClient(
+        timeout=10,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    ) as http:
+        return list(await asyncio.gather(
+            *(_send_whatsapp_reminder_async(http, *reminder) for reminder in reminders)
+        ))
\ No newline at end of file
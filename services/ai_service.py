@@ -1,43 +1,101 @@
+import asyncio
 import os
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Literal
 import google.generativeai as genai
+import orjson
 from loguru import logger
+from pydantic import BaseModel, Field
 from ..knowledge_base.manager import get_knowledge_base
 
+class ApptExtract(BaseModel):
+    """Shape Gemini is constrained to when extracting appointment details."""
+    intent: Literal['schedule', 'reschedule', 'cancel', 'other'] = 'other'
+    details: Dict[str, Any] = Field(default_factory=dict)
+    missing_info: List[str] = Field(default_factory=list)
+
+    class Config:
+        json_loads = orjson.loads
+
+# Built once; tells Gemini to emit JSON matching ApptExtract directly
+_EXTRACT_GENERATION_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': ApptExtract.schema(),
+}
+
+_SYSTEM_PROMPT = """You are SYRAA, an AI receptionist for a medical clinic. Your role is to assist
+patients with appointment scheduling, answering questions about the clinic, and providing helpful
+information. Be professional, empathetic, and concise in your responses.
+
+When scheduling appointments, always confirm:
+1. Patient's name
+2. Preferred date and time
+3. Reason for visit
+4. Preferred doctor (if any)
+
+If any information is missing, politely ask for clarification.
+"""
+
 class AIService:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
-        
+
         genai.configure(api_key=self.api_key)
         # Use the GEMINI_MODEL environment variable to select the Gemini model (e.g., 'gemini-1.5-pro')
-        self.model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-pro"))
+        self.model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+        self.model = genai.GenerativeModel(self.model_name)
         self.knowledge_base = get_knowledge_base()
-        self.conversation = self._start_conversation()
-    
+        self._cached_content = None
+        self._refresh_cached_context()
+        # One chat session per conversation_id, LRU-evicted; a single shared
+        # session would interleave unrelated callers' turns
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+
+    _MAX_SESSIONS = 1024
+
+    def _session_for(self, conversation_id: Optional[str]):
+        """Get or create the chat session for a conversation, LRU-bounded."""
+        key = conversation_id or "default"
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._start_conversation()
+            self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self._MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+        return session
+
+    def _refresh_cached_context(self):
+        """
+        Upload the system prompt and clinic context to Gemini's context cache
+        so every conversation references them by ID instead of resending
+        hundreds of tokens as a first turn. Falls back to inline context when
+        caching is unavailable (unsupported model, API error, expired TTL).
+        """
+        try:
+            self._cached_content = genai.caching.CachedContent.create(
+                model=self.model_name,
+                system_instruction=_SYSTEM_PROMPT,
+                contents=[self.knowledge_base.generate_context_prompt()],
+                ttl="1h",
+            )
+            self.model = genai.GenerativeModel.from_cached_content(self._cached_content)
+        except Exception as e:
+            logger.warning(f"Gemini context caching unavailable, using inline context: {e}")
+            self._cached_content = None
+            self.model = genai.GenerativeModel(self.model_name)
+
     def _start_conversation(self):
         """Start a new conversation with context from the knowledge base."""
-        system_prompt = """You are SYRAA, an AI receptionist for a medical clinic. Your role is to assist 
-        patients with appointment scheduling, answering questions about the clinic, and providing helpful 
-        information. Be professional, empathetic, and concise in your responses.
-        
-        When scheduling appointments, always confirm:
-        1. Patient's name
-        2. Preferred date and time
-        3. Reason for visit
-        4. Preferred doctor (if any)
-        
-        If any information is missing, politely ask for clarification.
-        """
-        
-        # Add clinic-specific context
+        if self._cached_content is not None:
+            # Context lives server-side in the cache; conversations start empty
+            return self.model.start_chat(history=[])
+
+        # Inline fallback: send system prompt + clinic context as the first turn
         clinic_context = self.knowledge_base.generate_context_prompt()
-        
-        # Combine with system prompt
-        full_context = f"{system_prompt}\n\n{clinic_context}"
-        
-        # Start the conversation with the model
+        full_context = f"{_SYSTEM_PROMPT}\n\n{clinic_context}"
         return self.model.start_chat(history=[
             {"role": "user", "parts": [full_context]},
             {"role": "model", "parts": ["I understand. I'm ready to assist patients with their needs."]}
@@ -54,15 +112,26 @@ class AIService:
         Returns:
             str: The AI's response
         """
+        session = self._session_for(conversation_id)
         try:
-            # Add conversation history if conversation_id is provided
-            # (Implementation depends on how you're storing conversation state)
-            
-            # Get response from the model
-            response = self.conversation.send_message(message)
+            # The SDK call is blocking; run it off the event loop so
+            # concurrent calls (on independent sessions) actually overlap
+            response = await asyncio.to_thread(session.send_message, message)
             return response.text
-            
+
         except Exception as e:
+            if self._cached_content is not None:
+                # The cached context may simply have hit its TTL; rebuild it,
+                # drop sessions bound to the stale model, and retry once
+                logger.warning(f"Retrying after possible context-cache expiry: {e}")
+                await asyncio.to_thread(self._refresh_cached_context)
+                self._sessions.clear()
+                session = self._session_for(conversation_id)
+                try:
+                    response = await asyncio.to_thread(session.send_message, message)
+                    return response.text
+                except Exception as retry_err:
+                    e = retry_err
             logger.error(f"Error generating AI response: {e}")
             return "I'm sorry, I'm having trouble processing your request. Please try again later."
     
@@ -77,24 +146,26 @@ class AIService:
         """
         prompt = f"""
         Analyze the following message from a patient and extract appointment details.
-        
+
         Message: "{message}"
-        
-        Return a JSON object with:
+
+        Extract:
         - intent: One of 'schedule', 'reschedule', 'cancel', or 'other'
         - details: Object with extracted fields (date, time, doctor, reason, etc.)
         - missing_info: List of missing required fields
-        
-        Only return the JSON object, no other text.
         """
-        
+
         try:
-            response = self.model.generate_content(prompt)
-            # Parse the response as JSON
-            import json
-            result = json.loads(response.text.strip())
-            return result
-            
+            # JSON response mode with a schema: the model emits conforming
+            # JSON, so no markdown fences or stray prose to strip, and
+            # parsing goes through orjson + pydantic validation
+            response = await asyncio.to_thread(
+                self.model.generate_content,
+                prompt,
+                generation_config=_EXTRACT_GENERATION_CONFIG,
+            )
+            return ApptExtract.parse_raw(response.text).dict()
+
         except Exception as e:
             logger.error(f"Error extracting appointment details: {e}")
             return {
@@ -0,0 +1,22 @@
+-- Single-statement guarded status change for appointments.
+-- Validates the current status and appends to notes server-side so the
+-- application does not need a read-modify-write round trip.
+create or replace function update_appointment_status(
+    p_appointment_id uuid,
+    p_status text,
+    p_notes_append text default null
+)
+returns setof appointments
+language sql
+as $$
+    update appointments
+    set status = p_status,
+        notes = case
+            when p_notes_append is null then notes
+            else btrim(coalesce(notes, '') || E'\n' || p_notes_append)
+        end,
+        updated_at = now()
+    where id = p_appointment_id
+      and status = 'scheduled'
+    returning *;
+$$;
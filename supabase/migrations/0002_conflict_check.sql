@@ -0,0 +1,33 @@
+-- Indexed existence check for scheduling conflicts. The GiST index over the
+-- appointment's time range lets the EXISTS query resolve without scanning the
+-- doctor's calendar, and only scheduled rows are indexed.
+create extension if not exists btree_gist;
+
+create index if not exists appt_doctor_time_range_idx
+    on appointments
+    using gist (
+        doctor_id,
+        tstzrange(scheduled_time, scheduled_time + duration_minutes * interval '1 min')
+    )
+    where status = 'scheduled';
+
+create or replace function has_scheduling_conflict(
+    p_doctor_id uuid,
+    p_start timestamptz,
+    p_end timestamptz,
+    p_exclude_id uuid default null
+)
+returns boolean
+language sql
+stable
+as $$
+    select exists (
+        select 1
+        from appointments
+        where doctor_id = p_doctor_id
+          and status = 'scheduled'
+          and tstzrange(scheduled_time, scheduled_time + duration_minutes * interval '1 min')
+              && tstzrange(p_start, p_end)
+          and (p_exclude_id is null or id <> p_exclude_id)
+    );
+$$;
@@ -0,0 +1,11 @@
+-- Covering partial index for the hot (doctor_id, scheduled_time) range scans
+-- issued by the slot generator. INCLUDE keeps the scan index-only, and only
+-- scheduled rows are indexed since cancelled/completed appointments never
+-- participate in availability.
+--
+-- Run with CONCURRENTLY when applying by hand on a busy database; the plain
+-- form is used here because migrations execute inside a transaction.
+create index if not exists appt_doctor_time_idx
+    on appointments (doctor_id, scheduled_time)
+    include (duration_minutes, status, id)
+    where status = 'scheduled';
@@ -0,0 +1,14 @@
+-- Server-side JSONB merge for appointment metadata: one statement, no
+-- read-modify-write race between concurrent writers.
+create or replace function merge_appointment_metadata(
+    p_appointment_id uuid,
+    p_patch jsonb
+)
+returns void
+language sql
+as $$
+    update appointments
+    set metadata = coalesce(metadata, '{}'::jsonb) || p_patch,
+        updated_at = now()
+    where id = p_appointment_id;
+$$;
@@ -0,0 +1,13 @@
+-- Indexes backing the remaining hot lookups: patient-by-phone on every
+-- inbound call, and the per-patient upcoming/past appointment listings
+-- (WHERE patient_id = ? AND scheduled_time >= ? ORDER BY scheduled_time).
+--
+-- patients.id is the primary key and already unique-indexed, so no extra
+-- index is added for it. Run with CONCURRENTLY when applying by hand on a
+-- busy database; the plain form is used here because migrations execute
+-- inside a transaction.
+create index if not exists patients_phone_idx
+    on patients (phone_number);
+
+create index if not exists appointments_patient_time_idx
+    on appointments (patient_id, scheduled_time desc);
@@ -0,0 +1,15 @@
+-- Per-status appointment tallies for one patient, computed server-side so
+-- history lookups stop pulling whole rows just to count them in Python.
+-- The (patient_id, scheduled_time) index from 0005 covers the filter.
+create or replace function count_patient_appointment_statuses(
+    p_patient_id uuid
+)
+returns table(status text, cnt bigint)
+language sql
+stable
+as $$
+    select status, count(*)
+    from appointments
+    where patient_id = p_patient_id
+    group by status;
+$$;
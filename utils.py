@@ -1,34 +1,69 @@
 import os
 import logging
+import secrets
+import time
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Union
 import re
 import phonenumbers
+from email_validator import validate_email as _validate_email, EmailNotValidError
 from phonenumbers import PhoneNumberFormat
 
+# Optional C-extension ISO-8601 parser (~100x faster than strptime);
+# parse_datetime works the same without it
+try:
+    import ciso8601
+    _fast_parse = ciso8601.parse_datetime
+except ImportError:
+    _fast_parse = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("utils")
 
+@lru_cache(maxsize=4096)
+def _parse_phone_cached(phone_number: str, country_code: str) -> tuple:
+    """
+    Parse a phone number once and cache (is_valid, e164). phonenumbers.parse
+    is pure Python and slow, and the same number typically flows through
+    validation, normalization and lookup in a single request.
+    """
+    try:
+        parsed = phonenumbers.parse(phone_number, country_code)
+        if not phonenumbers.is_valid_number(parsed):
+            return (False, None)
+        return (True, phonenumbers.format_number(parsed, PhoneNumberFormat.E164))
+    except Exception as e:
+        logger.debug(f"Error parsing phone number {phone_number}: {str(e)}")
+        return (False, None)
+
 def format_phone_number(phone_number: str, country_code: str = 'US') -> Optional[str]:
     """
     Format a phone number to E.164 format.
-    
+
     Args:
         phone_number: The phone number to format
         country_code: ISO 3166-1 alpha-2 country code (default: 'US')
-        
+
     Returns:
         Formatted phone number in E.164 format or None if invalid
     """
-    try:
-        parsed = phonenumbers.parse(phone_number, country_code)
-        if not phonenumbers.is_valid_number(parsed):
-            return None
-        return phonenumbers.format_number(parsed, PhoneNumberFormat.E164)
-    except Exception as e:
-        logger.warning(f"Error formatting phone number {phone_number}: {str(e)}")
-        return None
+    return _parse_phone_cached(phone_number, country_code)[1]
+
+# strptime candidates bucketed by input length, so an input only tries
+# the formats that could actually match instead of the whole list
+_FMT_BY_LEN = {
+    24: ('%Y-%m-%dT%H:%M:%S.%fZ',),                                # ISO 8601 with milliseconds
+    20: ('%Y-%m-%dT%H:%M:%SZ',),                                   # ISO 8601 without milliseconds
+    19: ('%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S'),
+    16: ('%Y-%m-%d %H:%M',),                                       # Date and time without seconds
+    10: ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y'),                      # Date only
+}
+
+# Full scan order for inputs whose length has no bucket (e.g. dates without
+# zero padding, which strptime still accepts)
+_ALL_FMTS = tuple(fmt for fmts in _FMT_BY_LEN.values() for fmt in fmts)
 
 def parse_datetime(dt_str: str) -> Optional[datetime]:
     """
@@ -36,42 +71,60 @@ def parse_datetime(dt_str: str) -> Optional[datetime]:
     """
     if not dt_str:
         return None
-        
-    # List of possible datetime formats to try
-    formats = [
-        '%Y-%m-%dT%H:%M:%S.%fZ',  # ISO 8601 with timezone
-        '%Y-%m-%dT%H:%M:%SZ',      # ISO 8601 without milliseconds
-        '%Y-%m-%d %H:%M:%S',       # SQL datetime
-        '%Y-%m-%d %H:%M',          # Date and time without seconds
-        '%Y-%m-%d',                # Date only
-        '%m/%d/%Y %H:%M:%S',       # US format with time
-        '%m/%d/%Y',                 # US format date only
-        '%d/%m/%Y %H:%M:%S',       # European format with time
-        '%d/%m/%Y',                 # European format date only
-    ]
-    
-    for fmt in formats:
+
+    dt = None
+
+    # Fastest path: ciso8601 when installed
+    if _fast_parse is not None:
         try:
-            dt = datetime.strptime(dt_str, fmt)
-            # If the datetime is naive, assume it's in local time and convert to UTC
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt.astimezone(timezone.utc)
+            dt = _fast_parse(dt_str)
         except ValueError:
-            continue
-    
-    logger.warning(f"Could not parse datetime string: {dt_str}")
-    return None
+            pass
+
+    # Fast path: C-implemented fromisoformat covers the dominant ISO-8601
+    # shapes coming back from the database and API
+    if dt is None:
+        try:
+            dt = datetime.fromisoformat(dt_str[:-1] if dt_str.endswith('Z') else dt_str)
+        except ValueError:
+            pass
+
+    if dt is None:
+        for fmt in _FMT_BY_LEN.get(len(dt_str), _ALL_FMTS):
+            try:
+                dt = datetime.strptime(dt_str, fmt)
+                break
+            except ValueError:
+                continue
+
+    if dt is None:
+        logger.warning(f"Could not parse datetime string: {dt_str}")
+        return None
+
+    # If the datetime is naive, assume it's in local time and convert to UTC
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
 
 def validate_email(email: str) -> bool:
     """
     Validate an email address format.
+
+    Uses the same email_validator engine as pydantic's EmailStr, so this
+    agrees with model-level validation; deliverability (DNS) checks are
+    skipped since only the syntax matters here.
     """
     if not email:
         return False
-    
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+
+    try:
+        _validate_email(email, check_deliverability=False)
+        return True
+    except EmailNotValidError:
+        return False
+
+# Escape map applied in one C-level pass instead of four chained replaces
+_SANITIZE_TABLE = str.maketrans({'"': '\\"', "'": "\\'", '<': '&lt;', '>': '&gt;'})
 
 def sanitize_input(input_str: str) -> str:
     """
@@ -79,27 +132,31 @@ def sanitize_input(input_str: str) -> str:
     """
     if not input_str:
         return ""
-    
-    # Remove or escape potentially dangerous characters
-    sanitized = input_str.replace('"', '\\"')
-    sanitized = sanitized.replace("'", "\\'")
-    sanitized = sanitized.replace('<', '&lt;')
-    sanitized = sanitized.replace('>', '&gt;')
-    
-    return sanitized
+
+    return input_str.translate(_SANITIZE_TABLE)
 
 def deep_merge(dict1: Dict, dict2: Dict) -> Dict:
     """
-    Recursively merge two dictionaries.
+    Merge two dictionaries, combining nested dicts key by key.
+
+    Iterative with an explicit work stack, so deeply nested metadata blobs
+    don't pay a Python call frame per level, and subtrees are only copied
+    when both sides actually need merging.
     """
-    result = dict1.copy()
-    
-    for key, value in dict2.items():
-        if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-            result[key] = deep_merge(result[key], value)
-        else:
-            result[key] = value
-            
+    result = dict(dict1)
+    stack = [(result, dict2)]
+
+    while stack:
+        dst, src = stack.pop()
+        for key, value in src.items():
+            current = dst.get(key)
+            if isinstance(current, dict) and isinstance(value, dict):
+                merged = dict(current)
+                dst[key] = merged
+                stack.append((merged, value))
+            else:
+                dst[key] = value
+
     return result
 
 def format_duration(minutes: int) -> str:
@@ -135,31 +192,38 @@ def is_development() -> bool:
     """
     return get_environment() == 'development'
 
+# Default sensitive-field names and a matching precompiled pattern, built
+# once instead of per call; custom field lists get a pattern on demand
+_DEFAULT_MASK = frozenset(('password', 'token', 'api_key', 'secret', 'auth'))
+_DEFAULT_MASK_RE = re.compile('|'.join(map(re.escape, _DEFAULT_MASK)), re.IGNORECASE)
+
 def mask_sensitive_data(data: Union[str, Dict, List], fields_to_mask: List[str] = None) -> Union[str, Dict, List]:
     """
     Mask sensitive data in strings, dictionaries, or lists.
     """
     if fields_to_mask is None:
-        fields_to_mask = ['password', 'token', 'api_key', 'secret', 'auth']
-    
+        pattern = _DEFAULT_MASK_RE
+    else:
+        pattern = re.compile('|'.join(map(re.escape, fields_to_mask)), re.IGNORECASE)
+    return _mask(data, pattern)
+
+def _mask(data: Union[str, Dict, List], pattern) -> Union[str, Dict, List]:
     if isinstance(data, str):
-        # Simple string masking (e.g., for logging)
-        for field in fields_to_mask:
-            if field.lower() in data.lower():
-                return '[REDACTED]'
-        return data
+        # Simple string masking (e.g., for logging); one C-level regex scan
+        # instead of a Python loop of substring checks
+        return '[REDACTED]' if pattern.search(data) else data
     elif isinstance(data, dict):
         # Recursively mask dictionary values
         result = {}
         for key, value in data.items():
-            if any(field in str(key).lower() for field in fields_to_mask):
+            if pattern.search(str(key)):
                 result[key] = '***MASKED***'
             else:
-                result[key] = mask_sensitive_data(value, fields_to_mask)
+                result[key] = _mask(value, pattern)
         return result
     elif isinstance(data, list):
         # Recursively mask list items
-        return [mask_sensitive_data(item, fields_to_mask) for item in data]
+        return [_mask(item, pattern) for item in data]
     else:
         return data
 
@@ -174,12 +238,7 @@ def validate_phone_number(phone_number: str, country_code: str = 'US') -> bool:
     Returns:
         bool: True if the phone number is valid, False otherwise
     """
-    try:
-        parsed = phonenumbers.parse(phone_number, country_code)
-        return phonenumbers.is_valid_number(parsed)
-    except Exception as e:
-        logger.debug(f"Error validating phone number {phone_number}: {str(e)}")
-        return False
+    return _parse_phone_cached(phone_number, country_code)[0]
 
 def normalize_phone_number(phone_number: str, country_code: str = 'US') -> Optional[str]:
     """
@@ -192,14 +251,7 @@ def normalize_phone_number(phone_number: str, country_code: str = 'US') -> Optio
     Returns:
         str: Normalized phone number in E.164 format or None if invalid
     """
-    try:
-        parsed = phonenumbers.parse(phone_number, country_code)
-        if not phonenumbers.is_valid_number(parsed):
-            return None
-        return phonenumbers.format_number(parsed, PhoneNumberFormat.E164)
-    except Exception as e:
-        logger.debug(f"Error normalizing phone number {phone_number}: {str(e)}")
-        return None
+    return _parse_phone_cached(phone_number, country_code)[1]
 
 def generate_reference_id(prefix: str = '') -> str:
     """
@@ -211,12 +263,11 @@ def generate_reference_id(prefix: str = '') -> str:
     Returns:
         str: A unique reference ID
     """
-    import uuid
-    import time
-    
+    # token_hex(4) draws exactly the 32 random bits the old uuid4().hex[:8]
+    # slice kept, without generating (and discarding most of) a full UUID
     timestamp = int(time.time())
-    unique_id = str(uuid.uuid4().hex)[:8]
-    
+    unique_id = secrets.token_hex(4)
+
     if prefix:
         return f"{prefix.upper()}_{timestamp}_{unique_id}"
     return f"{timestamp}_{unique_id}"